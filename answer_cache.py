@@ -0,0 +1,121 @@
+"""Persistent answer cache for the HR Assistant.
+
+Answers are keyed on the normalized question, document filter, model, prompt version and
+index version, so rebuilding the index or editing the prompt never serves a stale answer.
+Entries are evicted least-recently-used beyond a size cap and expire after a TTL."""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, unify quotes, collapse whitespace and drop trailing punctuation."""
+    text = question.replace("’", "'").replace("‘", "'").lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!. ")
+
+
+class AnswerCache:
+    """SQLite-backed answer cache, safe to share between threads and processes."""
+
+    def __init__(self, path: Path, max_entries: int = 2000, ttl_seconds: float = 7 * 24 * 3600):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    answer TEXT NOT NULL,
+                    index_version TEXT,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @staticmethod
+    def make_key(
+        question: str,
+        document_filter: Optional[str],
+        model: str,
+        prompt_version: str,
+        index_version: Optional[str],
+    ) -> str:
+        parts = [normalize_question(question), document_filter or "", model, prompt_version, index_version or ""]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def _count(self, name: str):
+        self._conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached answer or None. Every lookup is counted as a hit or a miss."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT answer, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._count("misses")
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self._count("hits")
+            return row[0]
+
+    def put(self, key: str, answer: str, index_version: Optional[str]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, index_version, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, answer, index_version, now, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate(self, current_index_version: Optional[str]) -> int:
+        """Drop every answer that was not produced from current_index_version."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM answers WHERE index_version IS NOT ?", (current_index_version,)
+            )
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.execute("DELETE FROM stats")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        hits = counts.get("hits", 0)
+        misses = counts.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,13 +1,19 @@
 """James Shield HR Assistant - Streamlit app."""
 
 import html
+import io
 import os
-from pathlib import Path
+import threading
+import uuid
 
 import streamlit as st
 from dotenv import load_dotenv
 
-from rag import get_answer, build_vector_store
+from history import HISTORY_DB, HISTORY_PAGE_SIZE, ChatHistory, HistoryStore
+from questions import FAQS, TOPICS
+from rag import PRECOMPUTED_FILE, get_engine, index_summary, index_version, load_precomputed_answers
+from rebuild import IndexRebuilder
+from telemetry import start_trace
 
 load_dotenv()
 
@@ -19,90 +25,6 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-# Topics with their questions - click topic to see questions, click question to get answer (3 per topic)
-TOPICS = {
-    "PTO": [
-        "How much PTO do I accrue each pay period?",
-        "Do unused PTO hours carry over to next year?",
-        "How do I request PTO and who needs to approve it?",
-        "How much sick leave do I receive and when can I use it?",
-    ],
-    "Holidays": [
-        "Which holidays are paid by the company?",
-        "What happens if a holiday falls on a weekend?",
-        "Do we get floating holidays, and how do I use them?",
-    ],
-    "Benefits": [
-        "When am I eligible for health insurance benefits?",
-        "How do I enroll or make changes to my benefits?",
-        "Does the company offer dental and vision coverage?",
-    ],
-    "New Hire": [
-        "How do I request time off as a new employee?",
-        "When do my benefits start and how do I enroll?",
-        "Who should I contact if I have questions during onboarding?",
-    ],
-    "Chemical Spill": [
-        "What should I do if a chemical spill occurs at work?",
-        "Who do I report a chemical spill to?",
-        "What safety equipment is required for chemical cleanup?",
-    ],
-    "Company Vehicle": [
-        "Who is eligible for a company vehicle?",
-        "What are the rules for using a company vehicle?",
-        "What should I do if I'm in an accident in a company vehicle?",
-    ],
-    "FMLA": [
-        "What is FMLA and who is eligible?",
-        "How do I request FMLA leave?",
-        "How much FMLA leave am I entitled to?",
-    ],
-    "Escalations": [
-        "How do I escalate an HR issue?",
-        "Who do I contact for HR escalations?",
-        "When should I escalate a concern to HR?",
-    ],
-    "Workplace Conduct": [
-        "What are the workplace conduct expectations?",
-        "How do I report harassment or discrimination?",
-        "What is the policy on workplace ethics?",
-    ],
-    "Remote Work": [
-        "Am I eligible to work remotely or hybrid?",
-        "What are the expected working hours for remote employees?",
-        "Does the company reimburse home office equipment?",
-    ],
-    "Reimbursement": [
-        "How do I submit expense reimbursements?",
-        "What expenses are reimbursable?",
-        "What is the reimbursement process and timeline?",
-    ],
-}
-
-# FAQ questions - click to search handbook and show answer
-FAQS = [
-    "What is the procedure if I am going to be late to work?",
-    "When am I eligible for benefits?",
-    "What happens if I forget to clock in or clock out?",
-    "Can I make up missed hours later in the week?",
-    "Do I need a doctor's note to return to work?",
-    "When am I eligible to start using my vacation time?",
-    "How much sick leave do I receive each year?",
-    "Do unused vacation or sick days carry over?",
-    "What do I do if I'm injured on the job?",
-    "How many vacation days do I get?",
-    "When does my health insurance coverage begin?",
-    "When can I change my insurance plans?",
-    "What happens to my benefits if I leave the company?",
-    "What holidays do I have off?",
-    "What should I do if I witness harassment or discrimination?",
-    "How do I report a safety concern?",
-    "When are we paid?",
-    "When am I eligible for the 401(k)?",
-    "Who is eligible to work remotely?",
-    "How is my performance evaluated when working from home?",
-]
-
 # Custom CSS - professional corporate theme
 st.markdown("""
 <style>
@@ -203,23 +125,205 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-def is_index_built():
-    """Check if ChromaDB vector store exists."""
-    chroma_path = Path(__file__).parent / "chroma_db"
-    return chroma_path.exists() and any(chroma_path.iterdir())
+LOGO_PATH = "assets/logo.png"
+LOGO_WIDTH = 90
+# How often the sidebar polls a running index rebuild
+REBUILD_POLL_SECONDS = 1.0
+
+
+@st.cache_data(show_spinner=False)
+def get_logo():
+    """Logo as PNG bytes already scaled to LOGO_WIDTH, or None if the file is missing.
+    st.image would otherwise decode and resize the full-size file on every rerun."""
+    if not os.path.exists(LOGO_PATH):
+        return None
+    from PIL import Image
+
+    image = Image.open(LOGO_PATH)
+    image = image.resize((LOGO_WIDTH, round(image.height * LOGO_WIDTH / image.width)), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@st.cache_resource(show_spinner=False)
+def warm_up_engine():
+    """Once per process, after the first page has rendered: open the index (importing
+    chromadb and openai) on a background thread so the first question does not wait for it."""
+    engine = get_engine()
+
+    def _load():
+        try:
+            engine.collection()
+            engine.embedder()
+        except Exception as e:
+            print(f"Error loading index: {e}")
+
+    threading.Thread(target=_load, name="warm-up", daemon=True).start()
+    return True
+
+
+def stream_answer(question: str) -> str:
+    """Write the answer into the page as it streams in and return the full text."""
+    status = st.empty()
+    status.caption("Searching the handbook...")
+    trace = start_trace(question, force=st.session_state.get("show_timing", False))
+
+    def _pieces():
+        for i, piece in enumerate(get_engine().stream_answer(question, trace=trace)):
+            if i == 0:
+                status.empty()
+            yield piece
+
+    answer = st.write_stream(_pieces())
+    if trace.enabled:
+        st.session_state.last_trace = trace.to_dict()
+    return answer
+
+
+def render_timing():
+    """Stage breakdown of the latest traced answer."""
+    trace = st.session_state.get("last_trace")
+    if not trace:
+        st.caption("_Ask a question to see its timing._")
+        return
+    st.caption(f"Total: {trace['total_ms']:.0f} ms · cache {trace.get('cache', 'off')} · index {trace.get('index_version') or '-'}")
+    st.table({"stage": list(trace["stages_ms"]), "ms": [round(ms, 1) for ms in trace["stages_ms"].values()]})
+    details = {k: trace[k] for k in ("answer_source", "faq_question", "faq_score", "candidates", "chunks", "context_tokens", "tokens_saved", "prompt_tokens", "completion_tokens") if k in trace}
+    if details:
+        st.json(details)
+
+
+@st.cache_data
+def _precomputed_answers(version, modified):
+    return load_precomputed_answers()
+
+
+def get_canned_answer(question: str):
+    """Precomputed answer for a FAQ/topic question, or None if the artifact is stale or missing."""
+    # The artifact is written after its index version goes live, so key on its mtime too
+    try:
+        modified = PRECOMPUTED_FILE.stat().st_mtime_ns
+    except OSError:
+        modified = None
+    return _precomputed_answers(index_version(), modified).get(question)
+
+
+@st.cache_data(show_spinner=False)
+def _index_summary(version):
+    return index_summary()
+
+
+def get_index_summary():
+    """Index document/chunk counts, re-read only when the index version changes."""
+    return _index_summary(index_version())
+
+
+@st.cache_resource
+def get_rebuilder():
+    """One background rebuild worker per process, shared by all sessions."""
+    return IndexRebuilder()
+
+
+@st.fragment(run_every=REBUILD_POLL_SECONDS)
+def render_rebuild_progress():
+    """Progress of the running rebuild. Polls on its own; once the rebuild has finished,
+    reruns the whole page once so the sidebar shows the new index."""
+    status = get_rebuilder().status()
+    if status["state"] == "running":
+        if status["total"]:
+            st.progress(status["done"] / status["total"], text=f"{status['stage']} ({status['done']}/{status['total']})")
+        else:
+            st.caption(f"{status['stage']}...")
+        st.caption("Answers come from the current index until the rebuild completes.")
+    elif st.session_state.get("rebuild_seen") != status["finished_at"]:
+        st.session_state.rebuild_seen = status["finished_at"]
+        st.rerun()
+
+
+@st.cache_resource
+def get_history_store():
+    """Shared SQLite history store, or None when HR_HISTORY_DB is not set."""
+    return HistoryStore(HISTORY_DB) if HISTORY_DB else None
+
+
+def get_history() -> ChatHistory:
+    """This session's chat history. With a history store, the session id lives in the URL
+    (?sid=...) so a reload picks the same history back up."""
+    if "history" not in st.session_state:
+        store = get_history_store()
+        session_id = st.query_params.get("sid")
+        if store is not None and not session_id:
+            session_id = uuid.uuid4().hex
+            st.query_params["sid"] = session_id
+        st.session_state.history = ChatHistory(session_id or uuid.uuid4().hex, store)
+    return st.session_state.history
+
+
+def _set_history_page(page: int):
+    st.session_state.history_page = page
+
+
+@st.fragment
+def render_history():
+    """One page of past Q&As, newest first. A fragment, so paging reruns only this block."""
+    history = get_history()
+    total = len(history)
+    if not total:
+        st.caption("_No questions yet. Ask a question to see history._")
+        return
+    pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+    page = min(st.session_state.get("history_page", 0), pages - 1)
+    for question, answer in history.page(page):
+        st.markdown(f"**Q:** {question}")
+        st.write(answer)
+        st.markdown("---")
+    if pages > 1:
+        prev_col, label_col, next_col = st.columns([1, 2, 1])
+        # Callbacks run before the fragment reruns, so the new page renders on this click
+        prev_col.button("‹", key="history_newer", disabled=page == 0, on_click=_set_history_page, args=(page - 1,))
+        label_col.caption(f"Page {page + 1} of {pages}")
+        next_col.button("›", key="history_older", disabled=page >= pages - 1, on_click=_set_history_page, args=(page + 1,))
 
 
 @st.dialog("FAQ Answer", width="medium")
-def show_faq_popup(question: str, answer: str):
+def show_faq_popup(question: str, answer=None):
     st.markdown(f"**Question**")
     st.markdown(question)
     st.markdown("---")
     st.markdown("**Answer**")
-    st.write(answer)
+    if answer is None:
+        stream_answer(question)
+    else:
+        st.write(answer)
     st.markdown("")
     st.caption("_Disclaimer: Answers are based on company policy documents and are for informational purposes only. For official guidance, contact HR._")
 
 
+@st.fragment
+def render_faqs():
+    """FAQ list. A fragment, so opening a FAQ reruns only this block, not the whole page."""
+    st.markdown("### FAQs")
+    with st.expander("View all questions", expanded=False):
+        for i, faq in enumerate(FAQS):
+            if st.button(
+                f"• {faq}",
+                key=f"faq_{i}",
+                use_container_width=True,
+                type="secondary",
+            ):
+                show_faq_popup(faq, get_canned_answer(faq))
+
+
+@st.fragment
+def render_timing_panel():
+    """Timing toggle and breakdown. A fragment, so flipping the toggle reruns only this block."""
+    st.toggle("Show timing details", key="show_timing")
+    if st.session_state.get("show_timing"):
+        with st.expander("**Timing (latest answer)**", expanded=True):
+            render_timing()
+
+
 def render_sidebar():
     """Render left sidebar with Index, FAQ, Help & scope, HR contact."""
     with st.sidebar:
@@ -231,50 +335,46 @@ def render_sidebar():
             st.rerun()
         st.divider()
         st.markdown("### Index")
-        built = is_index_built()
-        st.caption("Built" if built else "Not built")
+        summary = get_index_summary()
+        if summary:
+            st.caption(f"Built · {summary['documents']} documents · {summary['chunks']} chunks")
+        else:
+            st.caption("Not built")
+        cache = get_engine().cache
+        if cache is not None:
+            stats = cache.stats()
+            lookups = stats["hits"] + stats["misses"]
+            if lookups:
+                st.caption(f"Answer cache: {stats['hit_rate']:.0%} hit rate ({stats['hits']}/{lookups})")
 
         if st.button("Reset chat", use_container_width=True):
-            if "messages" in st.session_state:
-                st.session_state.messages = []
+            get_history().clear()
+            st.session_state.history_page = 0
             st.rerun()
 
-        if st.button("Rebuild index", use_container_width=True):
-            try:
-                with st.spinner("Rebuilding..."):
-                    build_vector_store()
-                st.toast("Index rebuilt!")
-            except Exception as e:
-                st.error(str(e))
+        rebuilder = get_rebuilder()
+        warm = st.checkbox("Precompute FAQ answers", value=True, key="warm_on_rebuild")
+        if st.button("Rebuild index", use_container_width=True, disabled=rebuilder.running):
+            rebuilder.start(warm=warm)
+        status = rebuilder.status()
+        # A rebuild that finished before this session started is not news to it
+        st.session_state.setdefault("rebuild_seen", status["finished_at"])
+        if status["state"] == "running" or st.session_state.get("rebuild_seen") != status["finished_at"]:
+            render_rebuild_progress()
+        elif status["state"] == "done":
+            st.caption(status["message"])
+        elif status["state"] == "failed":
+            st.error(f"Rebuild failed: {status['message']}")
 
         st.divider()
 
-        # History - dropdown to view all previous Q&As
+        # History - dropdown to page through previous Q&As
         with st.expander("**History**", expanded=False):
-            if st.session_state.get("messages"):
-                for i in range(0, len(st.session_state.messages), 2):
-                    if i + 1 < len(st.session_state.messages):
-                        st.markdown(f"**Q:** {st.session_state.messages[i]['content']}")
-                        st.write(st.session_state.messages[i + 1]["content"])
-                        st.markdown("---")
-            else:
-                st.caption("_No questions yet. Ask a question to see history._")
+            render_history()
 
         st.divider()
 
-        # FAQ dropdown - expander with questions as clickable links
-        st.markdown("### FAQs")
-        with st.expander("View all questions", expanded=False):
-            for i, faq in enumerate(FAQS):
-                if st.button(
-                    f"• {faq}",
-                    key=f"faq_{i}",
-                    use_container_width=True,
-                    type="secondary",
-                ):
-                    with st.spinner("Searching the handbook..."):
-                        answer = get_answer(faq)
-                    show_faq_popup(faq, answer)
+        render_faqs()
 
         st.divider()
 
@@ -286,14 +386,15 @@ def render_sidebar():
             st.markdown("[Email: HR@JamesShield.com](mailto:HR@JamesShield.com)")
             st.markdown("HR Hotline: 1-800-555-1234")
 
+        render_timing_panel()
+
         st.divider()
         st.markdown("**Disclaimer**")
         st.caption("_Answers are based on company policy documents and are for informational purposes only. For official guidance, contact HR._")
 
 
 def main():
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    history = get_history()
     if "view" not in st.session_state:
         st.session_state.view = "topics"
     if "selected_topic" not in st.session_state:
@@ -306,9 +407,9 @@ def main():
     # Main content - logo + heading
     col1, col2 = st.columns([1, 5])
     with col1:
-        logo_path = "assets/logo.png"
-        if os.path.exists(logo_path):
-            st.image(logo_path, width=90)
+        logo = get_logo()
+        if logo is not None:
+            st.image(logo, width=LOGO_WIDTH)
     with col2:
         st.markdown(
             '<h1 style="font-size: 1.75rem; font-weight: 600; color: #212529; letter-spacing: 0.02em; margin-bottom: 0;">JAMES SHIELD HR ASSISTANT</h1>',
@@ -345,10 +446,11 @@ def main():
             st.caption("Click a question to get the answer from the handbook.")
             for i, q in enumerate(TOPICS[topic]):
                 if st.button(q, key=f"q_{topic}_{i}", use_container_width=True, type="secondary"):
-                    with st.spinner("Searching the handbook..."):
-                        answer = get_answer(q)
-                    st.session_state.messages.append({"role": "user", "content": q})
-                    st.session_state.messages.append({"role": "assistant", "content": answer})
+                    answer = get_canned_answer(q)
+                    if answer is None:
+                        answer = stream_answer(q)
+                    history.add(q, answer)
+                    st.session_state.history_page = 0
                     st.session_state.show_latest_qa = True
                     st.rerun()
 
@@ -358,9 +460,9 @@ def main():
     st.markdown("---")
 
     # Latest Q&A - only show when not on "Back to Topics" (hidden when user returns to topics)
-    if st.session_state.messages and st.session_state.show_latest_qa:
-        last_q = st.session_state.messages[-2]["content"]
-        last_a = st.session_state.messages[-1]["content"]
+    latest = history.latest()
+    if latest and st.session_state.show_latest_qa:
+        last_q, last_a = latest
         q_content = html.escape(last_q).replace("\n", "<br>")
         a_content = html.escape(last_a).replace("\n", "<br>")
         st.markdown(
@@ -376,13 +478,15 @@ def main():
     # Chat input at bottom
     if prompt := st.chat_input("Ask an HR policy question..."):
         st.session_state.show_chat_hint = False
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.spinner("Searching the handbook..."):
-            answer = get_answer(prompt)
-        st.session_state.messages.append({"role": "assistant", "content": answer})
+        answer = stream_answer(prompt)
+        history.add(prompt, answer)
+        st.session_state.history_page = 0
         st.session_state.show_latest_qa = True
         st.rerun()
 
+    if get_index_summary():
+        warm_up_engine()
+
 
 if __name__ == "__main__":
     main()
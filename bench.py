@@ -0,0 +1,350 @@
+"""Offline benchmarks for indexing and query latency.
+
+Runs entirely against fake_openai.py, so no API key or network is needed:
+
+    python bench.py --sizes 19,200,1000 --output bench.json
+    python bench.py --sizes 19,200,1000 --compare bench.json
+
+For each corpus size (the real documents in data/, topped up with synthetic .docx files
+built from their paragraphs) a fresh worker process times document parsing, chunking,
+embedding, the collection build, a no-op rebuild, reloading the corpus from the
+parsed-document cache, retrieval alone, vector search alone with the chroma and numpy
+backends, and end-to-end answers over the FAQ and topic questions. Results are printed as JSON with throughput and p50/p95/p99 latencies.
+
+    python bench.py --app
+
+times the Streamlit app instead (through streamlit.testing.AppTest, in a fresh process
+over the real documents): time to first render including imports, time per rerun,
+and the first and a repeated chat question."""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+
+
+def percentiles(samples) -> dict:
+    """p50/p95/p99/max of samples (seconds) in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        position = (len(ordered) - 1) * q
+        low = int(position)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+    return {
+        "p50": round(pick(0.50) * 1000, 3),
+        "p95": round(pick(0.95) * 1000, 3),
+        "p99": round(pick(0.99) * 1000, 3),
+        "max": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 2) if seconds > 0 else 0.0
+
+
+# -- corpus ---------------------------------------------------------------------------
+
+def make_corpus(target: Path, size: int, pool: Path, seed: int = 7) -> int:
+    """Fill target/hr_docs with up to size real documents and target/hr_extra with
+    synthetic ones (generated into pool once and linked). Returns the document count."""
+    from docx import Document
+
+    from loader import read_paragraphs, scan_documents
+
+    real = [path for _, path in scan_documents(ROOT / "data")]
+    (target / "hr_docs").mkdir(parents=True, exist_ok=True)
+    (target / "hr_extra").mkdir(parents=True, exist_ok=True)
+    for path in real[:size]:
+        shutil.copy2(path, target / "hr_docs" / path.name)
+
+    synthetic = max(size - len(real), 0)
+    if synthetic:
+        pool.mkdir(parents=True, exist_ok=True)
+        paragraphs = [p for path in real for p in read_paragraphs(path)]
+        rng = random.Random(seed)
+        for i in range(synthetic):
+            doc_path = pool / f"Synthetic Policy {i:05d}.docx"
+            if not doc_path.exists():
+                doc = Document()
+                doc.add_heading(f"Synthetic Policy {i}", level=1)
+                for text in rng.sample(paragraphs, k=min(40, len(paragraphs))):
+                    doc.add_paragraph(text)
+                doc.save(doc_path)
+            os.symlink(doc_path, target / "hr_extra" / doc_path.name)
+    return min(size, len(real)) + synthetic
+
+
+# -- worker (runs in a fresh process with HR_DATA_DIR/HR_CHROMA_DIR pointing at the corpus) --
+
+def run_worker() -> dict:
+    import rag
+    from embeddings import embed_texts, get_provider
+    from loader import chunk_paragraphs, load_documents, read_paragraphs, scan_documents
+    from questions import canned_questions
+
+    files = scan_documents()
+    result = {"documents": len(files)}
+
+    parse_times, paragraphs = [], []
+    for _, path in files:
+        started = time.perf_counter()
+        paragraphs.append(read_paragraphs(path))
+        parse_times.append(time.perf_counter() - started)
+    result["parse"] = {
+        "seconds": round(sum(parse_times), 4),
+        "docs_per_second": _rate(len(files), sum(parse_times)),
+        "latency_ms": percentiles(parse_times),
+    }
+
+    started = time.perf_counter()
+    chunks = [chunk for doc in paragraphs for chunk in chunk_paragraphs(doc)]
+    seconds = time.perf_counter() - started
+    result["chunks"] = len(chunks)
+    result["chunk"] = {"seconds": round(seconds, 4), "chunks_per_second": _rate(len(chunks), seconds)}
+
+    started = time.perf_counter()
+    embed_texts(chunks, get_provider(), cache=None)
+    seconds = time.perf_counter() - started
+    result["embed"] = {"seconds": round(seconds, 4), "chunks_per_second": _rate(len(chunks), seconds)}
+
+    started = time.perf_counter()
+    rag.build_vector_store()
+    build_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    rag.build_vector_store()
+    result["build"] = {
+        "seconds": round(build_seconds, 4),
+        "chunks_per_second": _rate(len(chunks), build_seconds),
+        "noop_seconds": round(time.perf_counter() - started, 4),
+    }
+
+    # The build filled the parsed-document cache; load the corpus again from it
+    started = time.perf_counter()
+    load_documents()
+    result["load_cached"] = {"seconds": round(time.perf_counter() - started, 4)}
+
+    questions = canned_questions()
+    engine = rag.HandbookRAG(use_cache=False)
+    engine.collection()
+    for question in questions:
+        engine.retrieve(question)  # fill the query-embedding cache so only search is timed
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        engine.retrieve(question)
+        latencies.append(time.perf_counter() - started)
+    result["retrieve"] = {"count": len(questions), "latency_ms": percentiles(latencies)}
+
+    # Vector search alone, per backend: one question at a time, one question filtered to
+    # its closest document, and all questions in one batch
+    vectors, _ = engine._embed_queries(questions)
+    sources = [engine._vector_hits(None, [v])[0][0]["source"] for v in vectors]
+    for backend in ("chroma", "numpy"):
+        searcher = rag.HandbookRAG(use_cache=False, vector_backend=backend)
+        searcher.collection()
+        single, filtered = [], []
+        for vector, source in zip(vectors, sources):
+            started = time.perf_counter()
+            searcher._vector_hits(None, [vector])
+            single.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            searcher._vector_hits(source, [vector])
+            filtered.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        searcher._vector_hits(None, vectors)
+        result[f"vector_search_{backend}"] = {
+            "latency_ms": percentiles(single),
+            "filtered_latency_ms": percentiles(filtered),
+            "batch_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        engine.answer(question)
+        latencies.append(time.perf_counter() - started)
+    result["answer"] = {
+        "count": len(questions),
+        "per_second": _rate(len(questions), sum(latencies)),
+        "latency_ms": percentiles(latencies),
+    }
+
+    cached_engine = rag.HandbookRAG()
+    for question in questions:
+        cached_engine.answer(question)
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        cached_engine.answer(question)
+        latencies.append(time.perf_counter() - started)
+    result["answer_cached"] = {
+        "count": len(questions),
+        "per_second": _rate(len(questions), sum(latencies)),
+        "latency_ms": percentiles(latencies),
+    }
+    return result
+
+
+def run_app_worker(reruns: int = 50) -> dict:
+    """Time app.py the way a browser session drives it."""
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(str(ROOT / "app.py"), default_timeout=120)
+    app.run()
+    result = {"first_render_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+    # app.py opens the index on a background thread after the first render; time that
+    # separately so it does not bleed into the rerun samples
+    started = time.perf_counter()
+    for thread in threading.enumerate():
+        if thread.name == "warm-up":
+            thread.join()
+    result["warm_up_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    samples = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - started)
+    result["rerun_ms"] = percentiles(samples)
+
+    for name in ("first_question_ms", "repeat_question_ms"):
+        started = time.perf_counter()
+        app.chat_input[0].set_value("How much PTO do I get?").run()
+        result[name] = round((time.perf_counter() - started) * 1000, 3)
+    if app.exception:
+        result["exception"] = str(app.exception[0].value)
+    return result
+
+
+# -- driver ---------------------------------------------------------------------------
+
+def compare(current: dict, previous: dict):
+    """Print current/previous ratios for every numeric metric of matching corpus sizes."""
+    old_runs = {run["documents"]: run for run in previous.get("runs", [])}
+
+    def flatten(data, prefix=""):
+        for key, value in data.items():
+            if isinstance(value, dict):
+                yield from flatten(value, f"{prefix}{key}.")
+            elif isinstance(value, (int, float)):
+                yield f"{prefix}{key}", value
+
+    pairs = [(f"{run['documents']} documents", run, old_runs.get(run["documents"])) for run in current.get("runs", [])]
+    if "app" in current:
+        pairs.append(("app", current["app"], previous.get("app")))
+    for title, run, old in pairs:
+        if old is None:
+            continue
+        old_metrics = dict(flatten(old))
+        print(f"\n{title} (current / previous):", file=sys.stderr)
+        for name, value in flatten(run):
+            if old_metrics.get(name):
+                print(f"  {name:40s} {value:>12} {value / old_metrics[name]:>7.2f}x", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline indexing and query benchmarks")
+    parser.add_argument("--sizes", default="19,200,1000", help="comma-separated corpus sizes (documents)")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake seconds per embedding request")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="fake seconds per completion")
+    parser.add_argument("--workdir", help="keep corpora and indexes here instead of a temp dir")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    parser.add_argument("--app", action="store_true", help="benchmark the Streamlit app instead of indexing")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--app-worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker()))
+        return
+    if args.app_worker:
+        print(json.dumps(run_app_worker()))
+        return
+
+    from fake_openai import start_fake_server
+
+    server = start_fake_server(embed_latency=args.embed_latency, chat_latency=args.chat_latency)
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="hr-bench-"))
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "embed_latency": args.embed_latency,
+            "chat_latency": args.chat_latency,
+        },
+        "runs": [],
+    }
+    try:
+        if args.app:
+            run_dir = workdir / "app"
+            shutil.rmtree(run_dir, ignore_errors=True)
+            from loader import scan_documents
+
+            make_corpus(run_dir / "data", len(scan_documents(ROOT / "data")), workdir / "synthetic-pool")
+            env = dict(
+                os.environ,
+                OPENAI_API_KEY="fake-key",
+                OPENAI_BASE_URL=server.base_url,
+                HR_DATA_DIR=str(run_dir / "data"),
+                HR_CHROMA_DIR=str(run_dir / "chroma_db"),
+            )
+            print("Building index for the app benchmark...", file=sys.stderr)
+            subprocess.run([sys.executable, "build_db.py"], env=env, cwd=ROOT, capture_output=True, check=True)
+            print("Benchmarking app.py...", file=sys.stderr)
+            output = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "--app-worker"],
+                env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+            ).stdout
+            report["app"] = json.loads(output.strip().splitlines()[-1])
+        sizes = [] if args.app else [int(s) for s in args.sizes.split(",") if s.strip()]
+        for size in sizes:
+            run_dir = workdir / f"size-{size}"
+            shutil.rmtree(run_dir, ignore_errors=True)
+            print(f"Preparing {size} documents...", file=sys.stderr)
+            make_corpus(run_dir / "data", size, workdir / "synthetic-pool")
+            env = dict(
+                os.environ,
+                OPENAI_API_KEY="fake-key",
+                OPENAI_BASE_URL=server.base_url,
+                HR_DATA_DIR=str(run_dir / "data"),
+                HR_CHROMA_DIR=str(run_dir / "chroma_db"),
+            )
+            print(f"Benchmarking {size} documents...", file=sys.stderr)
+            output = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "--worker"],
+                env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+            ).stdout
+            report["runs"].append(json.loads(output.strip().splitlines()[-1]))
+        report["meta"]["fake_server"] = dict(server.stats)
+    finally:
+        server.shutdown()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,35 @@
-"""Build the vector store from handbook documents. Run once before first use."""
+"""Build the vector store from handbook documents. Run once before first use,
+and again whenever documents in data/ change - only changed files are re-embedded.
 
+Pass --warm to also precompute answers for every FAQ and topic question."""
+
+import argparse
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from rag import build_vector_store, load_documents
+from embeddings import EMBEDDING_PROVIDER
+from questions import canned_questions
+from rag import build_vector_store, format_build_report, precompute_answers
 
 if __name__ == "__main__":
-    if not os.getenv("OPENAI_API_KEY"):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--warm", action="store_true", help="precompute answers for the FAQ and topic questions")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent completions while warming (default 4)")
+    args = parser.parse_args()
+
+    # Local embedders build without a key; answering (and so --warm) always needs one
+    if not os.getenv("OPENAI_API_KEY") and (EMBEDDING_PROVIDER == "openai" or args.warm):
         print("Error: OPENAI_API_KEY not set. Add it to .env file.")
         exit(1)
-    texts, sources = load_documents()
-    print(f"Loaded {len(texts)} chunks from {len(set(sources))} documents")
-    print("Building vector store (this may take a minute)...")
-    build_vector_store()
+    print("Syncing vector store with data/ (first build may take a minute)...")
+    report = build_vector_store(progress=lambda done, total: print(f"\r  embedded {done}/{total} chunks", end="", flush=True))
+    print()
+    print(format_build_report(report))
+    if args.warm:
+        questions = canned_questions()
+        print(f"Precomputing answers for {len(questions)} canned questions...")
+        warm = precompute_answers(questions, max_workers=args.workers)
+        print(f"Precomputed {warm['answered']} answers ({warm['failed']} failed, {warm['seconds']:.1f}s)")
     print("Done! You can now run: streamlit run app.py")
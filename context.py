@@ -0,0 +1,109 @@
+"""Context assembly for the completion prompt.
+
+Retrieval returns a generous candidate list; this module decides what actually goes into
+the prompt: weak vector matches are dropped, near-duplicates removed, neighbouring chunks of
+the same document merged, and the result packed into a token budget."""
+
+import os
+import re
+
+from embeddings import approx_tokens
+
+# Cosine distance above which a vector-only hit is considered irrelevant
+MAX_DISTANCE = float(os.getenv("HR_MAX_DISTANCE", "0.75"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("HR_CONTEXT_TOKENS", "1200"))
+# Jaccard similarity of word sets above which two chunks count as duplicates
+DUPLICATE_THRESHOLD = 0.85
+
+SEPARATOR = "\n\n---\n\n"
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _words(text: str):
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def _jaccard(a, b) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _join_adjacent(first: str, second: str) -> str:
+    """Join two consecutive chunks, dropping paragraphs the second repeats from the first
+    (chunk overlap)."""
+    head = first.split("\n")
+    tail = second.split("\n")
+    for n in range(min(len(head), len(tail)), 0, -1):
+        if head[-n:] == tail[:n]:
+            tail = tail[n:]
+            break
+    return "\n".join(head + tail)
+
+
+def build_context(hits, token_budget: int = CONTEXT_TOKEN_BUDGET, max_distance: float = MAX_DISTANCE):
+    """Turn ranked hits into prompt context.
+
+    hits are dicts with text, file, position and distance (None for keyword-only hits), best
+    first. Returns (context, stats) where stats records candidate and used chunk/token counts
+    and the prompt tokens saved versus joining every candidate."""
+    candidate_tokens = approx_tokens(SEPARATOR.join(hit["text"] for hit in hits)) if hits else 0
+
+    # 1. Relevance threshold; the top hit always survives so the model can decide
+    relevant = [
+        hit for i, hit in enumerate(hits)
+        if i == 0 or hit["distance"] is None or hit["distance"] <= max_distance
+    ]
+
+    # 2. Near-duplicates (same paragraph repeated across policies, overlapping chunks)
+    kept, kept_words = [], []
+    for hit in relevant:
+        words = _words(hit["text"])
+        if any(_jaccard(words, other) >= DUPLICATE_THRESHOLD for other in kept_words):
+            continue
+        kept.append(hit)
+        kept_words.append(words)
+
+    # 3. Merge runs of consecutive chunks from the same document, ranked by their best member
+    blocks = []
+    by_file = {}
+    for rank, hit in enumerate(kept):
+        by_file.setdefault(hit["file"], []).append((hit["position"], rank, hit["text"]))
+    for members in by_file.values():
+        members.sort()
+        run = [members[0]]
+        for member in members[1:]:
+            if member[0] == run[-1][0] + 1:
+                run.append(member)
+                continue
+            blocks.append(run)
+            run = [member]
+        blocks.append(run)
+    merged = []
+    for run in blocks:
+        text = run[0][2]
+        for _, _, next_text in run[1:]:
+            text = _join_adjacent(text, next_text)
+        merged.append((min(rank for _, rank, _ in run), text))
+    merged.sort()
+
+    # 4. Pack into the token budget, best first; always keep the best block
+    parts, used_tokens = [], 0
+    for _, text in merged:
+        tokens = approx_tokens(text)
+        if parts and used_tokens + tokens > token_budget:
+            continue
+        parts.append(text)
+        used_tokens += tokens
+
+    context = SEPARATOR.join(parts)
+    context_tokens = approx_tokens(context) if parts else 0
+    stats = {
+        "candidates": len(hits),
+        "chunks_used": sum(1 for hit in kept if any(hit["text"] in part for part in parts)),
+        "candidate_tokens": candidate_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": max(candidate_tokens - context_tokens, 0),
+    }
+    return context, stats
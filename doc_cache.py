@@ -0,0 +1,195 @@
+"""On-disk cache of paragraphs extracted from .docx files.
+
+Opening a .docx with python-docx is the slowest local step of loading the corpus, so the
+paragraphs of every parsed file are kept in two files under HR_DOC_CACHE_DIR (default
+chroma_db/doc_cache):
+
+    index.json        per file key: path, size, mtime_ns, sha256, offset, length
+    paragraphs-*.bin  UTF-8 paragraphs, NUL-separated, appended file after file
+
+The blob is read through mmap, so a cached file costs a stat and a slice. An entry is
+reused while the file's size and mtime match; if only the mtime changed, the content hash
+decides. Entries are invalidated per file, and the blob is compacted once most of it is
+stale. Paragraphs rather than chunks are stored, so changing the chunk size keeps the cache."""
+
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+DOC_CACHE_DIR = Path(
+    os.getenv("HR_DOC_CACHE_DIR")
+    or Path(os.getenv("HR_CHROMA_DIR") or Path(__file__).parent / "chroma_db") / "doc_cache"
+)
+INDEX_NAME = "index.json"
+FORMAT_VERSION = 1
+# Paragraph separator; XML (and so .docx text) cannot contain NUL
+SEPARATOR = "\x00"
+# Rewrite the blob when less than this share of it is still referenced
+COMPACT_RATIO = 0.5
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentCache:
+    """Paragraph cache for one directory. Safe to share between threads; call save() (or
+    close()) to persist new entries."""
+
+    def __init__(self, directory: Path = DOC_CACHE_DIR):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._blob_name = None
+        self._file = None
+        self._map = None
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            index = json.loads((self.directory / INDEX_NAME).read_text())
+        except (OSError, ValueError):
+            return
+        if index.get("version") != FORMAT_VERSION or not (self.directory / index["blob"]).exists():
+            return
+        self._entries = index["files"]
+        self._blob_name = index["blob"]
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        self._map = self._file = None
+
+    def _drop_blob(self):
+        """Forget the blob and every entry in it; the next put() starts a new one. Used when
+        another process's compaction deleted the blob from under us."""
+        self._unmap()
+        self._entries = {}
+        self._blob_name = None
+        self._dirty = False
+
+    def _view(self, end: int):
+        """Map the blob, remapping when it has grown past the current mapping."""
+        if self._map is None or len(self._map) < end:
+            self._unmap()
+            self._file = open(self.directory / self._blob_name, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def get(self, key: str, path: Path) -> Optional[list]:
+        """Return the cached paragraphs of path, or None if it is not cached or changed."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["path"] != str(path):
+                entry = None
+            try:
+                stat = path.stat()
+            except OSError:
+                entry = None
+            if entry is not None and (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+                if entry["size"] == stat.st_size and file_sha256(path) == entry["sha256"]:
+                    entry["mtime_ns"] = stat.st_mtime_ns
+                    self._dirty = True
+                else:
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            start = entry["offset"]
+            try:
+                data = self._view(start + entry["length"])[start:start + entry["length"]] if entry["length"] else b""
+            except FileNotFoundError:
+                self._drop_blob()
+                self.misses += 1
+                return None
+            self.hits += 1
+        if not data:
+            return []
+        return data.decode("utf-8").split(SEPARATOR)
+
+    def put(self, key: str, path: Path, paragraphs):
+        """Cache the paragraphs parsed from path (fingerprinted as it is now)."""
+        stat = path.stat()
+        digest = file_sha256(path)
+        data = SEPARATOR.join(paragraphs).encode("utf-8")
+        with self._lock:
+            if self._blob_name is not None and not (self.directory / self._blob_name).exists():
+                self._drop_blob()
+            if self._blob_name is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._blob_name = f"paragraphs-{time.time_ns()}.bin"
+            with open(self.directory / self._blob_name, "ab") as f:
+                offset = f.tell()
+                f.write(data)
+            self._entries[key] = {
+                "path": str(path),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": digest,
+                "offset": offset,
+                "length": len(data),
+            }
+            self._dirty = True
+
+    def _compact(self):
+        """Copy the live entries into a fresh blob; returns the name of the old one."""
+        old_name = self._blob_name
+        new_name = f"paragraphs-{time.time_ns()}.bin"
+        end = max((e["offset"] + e["length"] for e in self._entries.values()), default=0)
+        view = self._view(end) if end else b""
+        with open(self.directory / new_name, "wb") as f:
+            for entry in self._entries.values():
+                data = view[entry["offset"]:entry["offset"] + entry["length"]]
+                entry["offset"] = f.tell()
+                f.write(data)
+        self._unmap()
+        self._blob_name = new_name
+        return old_name
+
+    def save(self):
+        """Persist the index, dropping entries of deleted files and compacting the blob
+        when most of it is stale."""
+        with self._lock:
+            live_entries = {k: e for k, e in self._entries.items() if os.path.exists(e["path"])}
+            if len(live_entries) != len(self._entries):
+                self._entries = live_entries
+                self._dirty = True
+            if not self._dirty or self._blob_name is None:
+                return
+            stale = None
+            try:
+                blob_size = (self.directory / self._blob_name).stat().st_size
+                live = sum(e["length"] for e in self._entries.values())
+                if blob_size and live < blob_size * COMPACT_RATIO:
+                    stale = self._compact()
+            except FileNotFoundError:
+                self._drop_blob()
+                return
+            tmp = self.directory / (INDEX_NAME + ".tmp")
+            tmp.write_text(json.dumps({"version": FORMAT_VERSION, "blob": self._blob_name, "files": self._entries}))
+            os.replace(tmp, self.directory / INDEX_NAME)
+            if stale is not None:
+                try:
+                    (self.directory / stale).unlink()
+                except OSError:
+                    pass
+            self._dirty = False
+
+    def close(self):
+        self.save()
+        with self._lock:
+            self._unmap()
@@ -0,0 +1,321 @@
+"""Embedding providers and the embedding stage for index builds.
+
+HR_EMBEDDING_PROVIDER selects how text is embedded:
+    openai   - OpenAI API, model HR_EMBEDDING_MODEL (default text-embedding-3-small)
+    local    - all-MiniLM-L6-v2 on CPU via the ONNX runtime bundled with chromadb
+               (the model is downloaded once, then no network is needed)
+    hashing  - signed feature hashing of words; no model and no network at all
+
+For builds, texts are batched by an approximate token budget, embedded with a bounded
+number of concurrent requests, retried with exponential backoff on rate limits and server
+errors, and cached on disk by (provider name, text hash) so re-indexing unchanged text
+costs nothing. The OpenAI client honours OPENAI_BASE_URL, so the stage can be pointed at a
+local fake embedding server for tests and benchmarks.
+
+openai and chromadb are imported only when a provider that needs them is created, so
+importing this module stays cheap."""
+
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Optional
+
+from scheduler import is_retryable, retry_delay
+
+EMBEDDING_PROVIDER = os.getenv("HR_EMBEDDING_PROVIDER", "openai").lower()
+EMBEDDING_MODEL = os.getenv("HR_EMBEDDING_MODEL", "text-embedding-3-small")
+HASHING_DIMENSIONS = 512
+QUERY_CACHE_SIZE = 1024
+
+# text-embedding-3-* accept up to 2048 inputs and 300k tokens per request; stay well under
+MAX_BATCH_TOKENS = 100_000
+MAX_BATCH_ITEMS = 512
+MAX_WORKERS = 4
+MAX_RETRIES = 6
+
+
+class EmbeddingProvider:
+    """Turns texts into vectors. name identifies the vector space: an index built with one
+    provider name cannot be queried with another."""
+
+    name = "base"
+    # Remote providers are rate-limited API calls and go through the LLM scheduler
+    remote = False
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+    def for_batches(self) -> "EmbeddingProvider":
+        """The provider to use inside embed_texts, which does its own retries."""
+        return self
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    remote = True
+
+    def __init__(self, model: str = EMBEDDING_MODEL, client=None, api_key: Optional[str] = None):
+        if client is None:
+            from openai import OpenAI
+
+            client = OpenAI(api_key=api_key)
+        self.model = model
+        self.name = f"openai:{model}"
+        self.client = client
+
+    def embed(self, texts):
+        response = self.client.embeddings.create(model=self.model, input=list(texts))
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    def for_batches(self):
+        return OpenAIEmbeddingProvider(self.model, client=self.client.with_options(max_retries=0))
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """all-MiniLM-L6-v2 (384 dimensions) on CPU through chromadb's bundled ONNX runtime."""
+
+    name = "local:all-MiniLM-L6-v2"
+
+    def __init__(self):
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+        self._function = DefaultEmbeddingFunction()
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        with self._lock:
+            return [[float(x) for x in vector] for vector in self._function(list(texts))]
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def hashing_embedding(text: str, dimensions: int = HASHING_DIMENSIONS):
+    """Unit-length vector from signed word hashes; similar wording gives similar vectors."""
+    vector = [0.0] * dimensions
+    for word in _WORD_RE.findall(text.lower()):
+        h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+        vector[h % dimensions] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Feature-hashing embedder: lexical quality only, but instant and fully offline."""
+
+    def __init__(self, dimensions: int = HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.name = f"hashing:{dimensions}"
+
+    def embed(self, texts):
+        return [hashing_embedding(t, self.dimensions) for t in texts]
+
+
+def get_provider(name: Optional[str] = None, api_key: Optional[str] = None, client=None) -> EmbeddingProvider:
+    """Build the configured provider (HR_EMBEDDING_PROVIDER unless name is given)."""
+    name = (name or EMBEDDING_PROVIDER).lower()
+    if name == "openai":
+        return OpenAIEmbeddingProvider(EMBEDDING_MODEL, client=client, api_key=api_key)
+    if name == "local":
+        return LocalEmbeddingProvider()
+    if name == "hashing":
+        return HashingEmbeddingProvider()
+    raise ValueError(f"Unknown HR_EMBEDDING_PROVIDER {name!r} (expected openai, local or hashing)")
+
+
+def provider_name(name: Optional[str] = None) -> str:
+    """The name the configured provider will report, without constructing it."""
+    name = (name or EMBEDDING_PROVIDER).lower()
+    if name == "openai":
+        return f"openai:{EMBEDDING_MODEL}"
+    if name == "local":
+        return LocalEmbeddingProvider.name
+    if name == "hashing":
+        return f"hashing:{HASHING_DIMENSIONS}"
+    raise ValueError(f"Unknown HR_EMBEDDING_PROVIDER {name!r} (expected openai, local or hashing)")
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU of query text -> vector, so repeated questions skip embedding."""
+
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str):
+        with self._lock:
+            vector = self._items.get(text)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(text)
+            self.hits += 1
+            return vector
+
+    def put(self, text: str, vector):
+        with self._lock:
+            self._items[text] = vector
+            self._items.move_to_end(text)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def approx_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk vector cache keyed by provider name and text hash."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, key)
+                )"""
+            )
+
+    def get_many(self, model: str, keys) -> dict:
+        """Return {key: vector} for the keys that are cached."""
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def put_many(self, model: str, items):
+        """Store (key, vector) pairs."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)",
+                [(model, key, array("f", vector).tobytes()) for key, vector in items],
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def make_batches(texts, max_tokens: int = MAX_BATCH_TOKENS, max_items: int = MAX_BATCH_ITEMS):
+    """Group text indexes into batches that stay under the token and item budgets."""
+    batches = []
+    current, current_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = approx_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _embed_batch(provider: EmbeddingProvider, texts, max_retries: int, schedule=None):
+    if schedule is not None:
+        return schedule(lambda: provider.embed(texts), sum(approx_tokens(t) for t in texts))
+    for attempt in range(max_retries + 1):
+        try:
+            return provider.embed(texts)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            time.sleep(retry_delay(e, attempt))
+
+
+def embed_texts(
+    texts,
+    provider: EmbeddingProvider,
+    cache: Optional[EmbeddingCache] = None,
+    max_workers: int = MAX_WORKERS,
+    max_batch_tokens: int = MAX_BATCH_TOKENS,
+    max_retries: int = MAX_RETRIES,
+    progress: Optional[Callable[[int, int], None]] = None,
+    schedule: Optional[Callable] = None,
+):
+    """Return one embedding per text from provider, in order.
+
+    Cached vectors are reused; the rest are embedded in token-budgeted batches with at most
+    max_workers requests in flight. progress(done, total) is called as texts complete.
+    With schedule(fn, tokens), each batch request is run through it (e.g. the LLM
+    scheduler, which then also does the retries) instead of being retried here."""
+    texts = list(texts)
+    keys = [text_key(t) for t in texts]
+    vectors = [None] * len(texts)
+
+    model = provider.name
+    cached = cache.get_many(model, set(keys)) if cache is not None else {}
+    for i, key in enumerate(keys):
+        if key in cached:
+            vectors[i] = cached[key]
+
+    # Embed each distinct missing text once
+    missing = {}
+    for i, key in enumerate(keys):
+        if vectors[i] is None:
+            missing.setdefault(key, []).append(i)
+    missing_keys = list(missing)
+    missing_texts = [texts[missing[k][0]] for k in missing_keys]
+
+    done = len(texts) - sum(len(v) for v in missing.values())
+    if progress:
+        progress(done, len(texts))
+    if not missing_keys:
+        return vectors
+
+    provider = provider.for_batches()
+    batches = make_batches(missing_texts, max_tokens=max_batch_tokens)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(_embed_batch, provider, [missing_texts[i] for i in batch], max_retries, schedule): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            batch_vectors = future.result()
+            if cache is not None:
+                cache.put_many(model, [(missing_keys[i], v) for i, v in zip(batch, batch_vectors)])
+            for i, vector in zip(batch, batch_vectors):
+                for position in missing[missing_keys[i]]:
+                    vectors[position] = vector
+                done += len(missing[missing_keys[i]])
+            if progress:
+                progress(done, len(texts))
+    return vectors
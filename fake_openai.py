@@ -0,0 +1,166 @@
+"""Local stand-in for the OpenAI embeddings and chat completions endpoints.
+
+Used by bench.py so benchmarks never hit the real API, and handy for trying the app
+offline:
+
+    python fake_openai.py --port 8765 --chat-latency 0.3
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake streamlit run app.py
+
+Embeddings are deterministic hashed bag-of-words vectors, so similar texts get similar
+vectors. Chat completions echo the start of the retrieved context and support streaming.
+GET /stats returns request counts."""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from embeddings import hashing_embedding
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, dim: int = 256, embed_latency: float = 0.0, chat_latency: float = 0.0, token_delay: float = 0.0):
+        super().__init__(address, _Handler)
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.chat_latency = chat_latency
+        self.token_delay = token_delay
+        self.stats = {"embedding_requests": 0, "embedded_texts": 0, "chat_requests": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[name] += n
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(dict(self.server.stats))
+        else:
+            self._send_json({"error": "Not found"}, 404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path.endswith("/embeddings"):
+            self._embeddings(body)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(body)
+        else:
+            self._send_json({"error": "Not found"}, 404)
+
+    def _embeddings(self, body: dict):
+        server = self.server
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        server.count("embedding_requests")
+        server.count("embedded_texts", len(texts))
+        if server.embed_latency:
+            time.sleep(server.embed_latency)
+        tokens = sum(len(t) // 4 + 1 for t in texts)
+        self._send_json({
+            "object": "list",
+            "model": body.get("model", "fake"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": hashing_embedding(t, server.dim)}
+                for i, t in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _chat(self, body: dict):
+        server = self.server
+        server.count("chat_requests")
+        if server.chat_latency:
+            time.sleep(server.chat_latency)
+        prompt = body["messages"][-1]["content"]
+        context = prompt.split("Context from handbook:", 1)[-1].split("Question:", 1)[0].strip()
+        answer = " ".join(context.split()[:40]) or "No context."
+        prompt_tokens = sum(len(m["content"]) // 4 + 1 for m in body["messages"])
+        completion_tokens = len(answer) // 4 + 1
+        model = body.get("model", "fake")
+
+        if not body.get("stream"):
+            self._send_json({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for word in answer.split(" "):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if server.token_delay:
+                time.sleep(server.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def start_fake_server(host: str = "127.0.0.1", port: int = 0, **options) -> FakeOpenAIServer:
+    """Start a fake server on a background thread (port 0 picks a free port)."""
+    server = FakeOpenAIServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI embeddings/chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=256, help="embedding dimensions")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per embedding request")
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="seconds before a completion starts")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed words")
+    args = parser.parse_args()
+    server = FakeOpenAIServer(
+        (args.host, args.port),
+        dim=args.dim,
+        embed_latency=args.embed_latency,
+        chat_latency=args.chat_latency,
+        token_delay=args.token_delay,
+    )
+    print(f"Fake OpenAI API on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Extractive answers from FAQ documents.
+
+The loader pulls question/answer pairs out of documents laid out as an FAQ (see
+loader.extract_faq_pairs) and the build stores them in the index manifest. FaqIndex holds
+those questions in memory; when a user's question matches one closely enough, the engine
+returns the stored answer as-is, with no retrieval and no completion.
+
+A match is an identical question after normalisation, or a stemmed-keyword overlap
+(Jaccard) of at least HR_FAQ_MIN_SCORE (default 0.8). The bar is high on purpose: a near
+miss ("sick days" for "vacation days") must fall through to the normal RAG path."""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from answer_cache import normalize_question
+from lexical import tokenize
+from telemetry import METRICS
+
+FAQ_MIN_SCORE = float(os.getenv("HR_FAQ_MIN_SCORE", "0.8"))
+
+METRICS.describe("hr_faq_answers_total", "counter", "Answers served from FAQ pairs without a completion.")
+
+
+@dataclass
+class FaqMatch:
+    question: str
+    answer: str
+    source: str
+    score: float
+
+
+class FaqIndex:
+    """Questions of the FAQ pairs, indexed by normalised text and by keyword."""
+
+    def __init__(self, pairs=()):
+        """pairs: (question, answer, source) tuples."""
+        self._pairs = []
+        self._exact = {}
+        self._tokens = []
+        self._postings = {}  # keyword -> positions of the questions that contain it
+        for question, answer, source in pairs:
+            position = len(self._pairs)
+            self._pairs.append((question, answer, source))
+            self._exact.setdefault(normalize_question(question), position)
+            tokens = frozenset(tokenize(question))
+            self._tokens.append(tokens)
+            for token in tokens:
+                self._postings.setdefault(token, set()).add(position)
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def match(
+        self, question: str, source: Optional[str] = None, min_score: float = FAQ_MIN_SCORE
+    ) -> Optional[FaqMatch]:
+        """Best FAQ entry for question (only from source when given), or None if none
+        scores at least min_score."""
+        if not self._pairs:
+            return None
+        best, best_score = self._exact.get(normalize_question(question)), 1.0
+        if best is None or (source and self._pairs[best][2] != source):
+            best, best_score = None, 0.0
+            tokens = frozenset(tokenize(question))
+            candidates = set().union(*(self._postings.get(token, ()) for token in tokens)) if tokens else ()
+            for position in candidates:
+                if source and self._pairs[position][2] != source:
+                    continue
+                score = len(tokens & self._tokens[position]) / len(tokens | self._tokens[position])
+                if score > best_score:
+                    best, best_score = position, score
+        if best is None or best_score < min_score:
+            return None
+        question, answer, source = self._pairs[best]
+        return FaqMatch(question, answer, source, best_score)
@@ -0,0 +1,112 @@
+"""Per-session chat history for the Streamlit app.
+
+Each session keeps at most HR_HISTORY_MAX question/answer pairs (default 50); older ones
+are dropped. When HR_HISTORY_DB names a SQLite file, history is kept there instead of in
+the session, keyed by a session id, so it survives page reloads and only the latest pair
+stays in memory. Pages are read on demand either way."""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+HISTORY_MAX = int(os.getenv("HR_HISTORY_MAX", "50"))
+HISTORY_DB = os.getenv("HR_HISTORY_DB")
+HISTORY_PAGE_SIZE = 5
+
+
+class HistoryStore:
+    """SQLite-backed history shared by all sessions, safe to share between threads."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS history_session ON history (session_id, id)")
+
+    def add(self, session_id: str, question: str, answer: str, max_items: int):
+        """Append a pair and drop the session's oldest pairs beyond max_items."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO history (session_id, question, answer, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, question, answer, time.time()),
+            )
+            self._conn.execute(
+                """DELETE FROM history WHERE session_id = ? AND id NOT IN (
+                    SELECT id FROM history WHERE session_id = ? ORDER BY id DESC LIMIT ?
+                )""",
+                (session_id, session_id, max_items),
+            )
+
+    def count(self, session_id: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM history WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+    def page(self, session_id: str, offset: int, limit: int):
+        """Return [(question, answer)], newest first."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT question, answer FROM history WHERE session_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                (session_id, limit, offset),
+            ).fetchall()
+
+    def clear(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM history WHERE session_id = ?", (session_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ChatHistory:
+    """History of one session: a capped deque, or a HistoryStore when one is given."""
+
+    def __init__(self, session_id: str, store: Optional[HistoryStore] = None, max_items: int = HISTORY_MAX):
+        self.session_id = session_id
+        self.store = store
+        self.max_items = max_items
+        self._items = deque(maxlen=1 if store is not None else max_items)
+        if store is not None:
+            self._items.extend(reversed(store.page(session_id, 0, 1)))
+
+    def add(self, question: str, answer: str):
+        self._items.append((question, answer))
+        if self.store is not None:
+            self.store.add(self.session_id, question, answer, self.max_items)
+
+    def latest(self):
+        """The most recent (question, answer), or None."""
+        return self._items[-1] if self._items else None
+
+    def __len__(self):
+        if self.store is not None:
+            return self.store.count(self.session_id)
+        return len(self._items)
+
+    def page(self, number: int, size: int = HISTORY_PAGE_SIZE):
+        """Return page number (0 = newest) as [(question, answer)], newest first."""
+        if self.store is not None:
+            return self.store.page(self.session_id, number * size, size)
+        newest_first = list(reversed(self._items))
+        return newest_first[number * size:(number + 1) * size]
+
+    def clear(self):
+        self._items.clear()
+        if self.store is not None:
+            self.store.clear(self.session_id)
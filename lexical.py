@@ -0,0 +1,124 @@
+"""In-process BM25 index over the handbook chunks, used alongside the Chroma vector search.
+
+Exact policy terms ("FMLA", "401(k)", "accrue") are often missed by embeddings alone; BM25
+catches them in microseconds. Results from both retrievers are merged with reciprocal-rank
+fusion (see rrf_fuse)."""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in into is it its "
+    "me my of on or our so that the their them there these they this to was we were what "
+    "when where which who why will with you your".split()
+)
+
+_SUFFIXES = ("ations", "ation", "ing", "ies", "ied", "al", "ed", "es", "s", "e")
+
+
+def stem(word: str) -> str:
+    """Very light suffix stripping so accrue/accrued/accrual or policy/policies match."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            if suffix in ("ies", "ied"):
+                return word[: -len(suffix)] + "y"
+            if suffix == "s" and word.endswith("ss"):
+                return word
+            return word[: -len(suffix)]
+    return word
+
+
+def tokenize(text: str):
+    return [stem(t) for t in TOKEN_RE.findall(text.lower().replace("’", "'")) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over chunks, with optional restriction to one source document.
+
+    Chunk text and source are kept so lexical-only hits can be used as context directly."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = {}  # id -> (text, source)
+        self._lengths = {}
+        self._postings = {}  # term -> {id: term frequency}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, chunk_id: str, text: str, source: str):
+        if chunk_id in self.docs:
+            self.remove(chunk_id)
+        tokens = tokenize(text)
+        self.docs[chunk_id] = (text, source)
+        self._lengths[chunk_id] = len(tokens)
+        self._total_length += len(tokens)
+        for term, tf in Counter(tokens).items():
+            self._postings.setdefault(term, {})[chunk_id] = tf
+
+    def remove(self, chunk_id: str):
+        if chunk_id not in self.docs:
+            return
+        text, _ = self.docs.pop(chunk_id)
+        self._total_length -= self._lengths.pop(chunk_id)
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, k: int = 10, source: Optional[str] = None):
+        """Return up to k (chunk_id, score) pairs, best first."""
+        if not self.docs:
+            return []
+        n = len(self.docs)
+        avg_length = self._total_length / n or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings.items():
+                if source is not None and self.docs[chunk_id][1] != source:
+                    continue
+                norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def save(self, path: Path):
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"k1": self.k1, "b": self.b, "docs": self.docs}))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        """Load a saved index; a missing or unreadable file gives an empty index."""
+        try:
+            data = json.loads(Path(path).read_text())
+        except (OSError, ValueError):
+            return cls()
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        for chunk_id, (text, source) in data.get("docs", {}).items():
+            index.add(chunk_id, text, source)
+        return index
+
+
+def rrf_fuse(rankings, k: int = 60):
+    """Reciprocal-rank fusion: merge ranked id lists into one, best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
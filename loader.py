@@ -0,0 +1,217 @@
+"""Document loading for the HR Assistant: scan data/ for .docx files, parse them across a
+process pool and split them into paragraph chunks. Documents laid out as questions and
+answers (FAQs) also yield their question/answer pairs.
+
+Kept free of chromadb/openai imports so pool workers start quickly; python-docx is
+imported on first parse so listing documents stays cheap. Extracted paragraphs are kept
+in doc_cache, so unchanged files are never reopened."""
+
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from doc_cache import DocumentCache
+
+DATA_DIR = Path(os.getenv("HR_DATA_DIR") or Path(__file__).parent / "data")
+DOC_FOLDERS = ["hr_docs", "hr_extra"]
+
+CHUNK_SIZE = int(os.getenv("HR_CHUNK_SIZE", "600"))
+CHUNK_OVERLAP = int(os.getenv("HR_CHUNK_OVERLAP", "0"))
+
+# Below this many files the process pool costs more than it saves
+PARALLEL_MIN_FILES = 4
+
+# A document is treated as an FAQ when it has at least this many answered questions,
+# nearly all of its questions are answered and questions are a good share of its paragraphs
+# (a handbook with a few question headings is not an FAQ)
+FAQ_MIN_PAIRS = 3
+FAQ_ANSWERED_RATIO = 0.8
+FAQ_MIN_QUESTION_SHARE = 0.1
+_QUESTION_PREFIX_RE = re.compile(r"^(?:q|question)\s*\d*\s*[:.)]\s*", re.IGNORECASE)
+_ANSWER_PREFIX_RE = re.compile(r"^(?:a|answer)\s*[:.)]\s*", re.IGNORECASE)
+
+_scan_cache = {}
+
+
+def scan_documents(data_dir: Path = DATA_DIR):
+    """Return [(key, path)] for every .docx in the data folders, skipping Word lock files.
+    key is the path relative to data_dir and identifies the file in the index manifest.
+
+    The result is reused until a folder's mtime changes (a file was added, removed or renamed)."""
+    data_dir = Path(data_dir)
+    stamp = []
+    for folder in DOC_FOLDERS:
+        try:
+            stamp.append((data_dir / folder).stat().st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    stamp = tuple(stamp)
+    cached = _scan_cache.get(data_dir)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    files = []
+    for folder in DOC_FOLDERS:
+        folder_path = data_dir / folder
+        if not folder_path.exists():
+            continue
+        for docx_file in sorted(folder_path.glob("*.docx")):
+            if docx_file.name.startswith("~$"):
+                continue
+            files.append((f"{folder}/{docx_file.name}", docx_file))
+    _scan_cache[data_dir] = (stamp, files)
+    return files
+
+
+def get_document_list(data_dir: Path = DATA_DIR):
+    """Return list of document names (without .docx) for filtering."""
+    return sorted({path.name for _, path in scan_documents(data_dir)})
+
+
+def read_paragraphs(docx_file: Path):
+    """Return the non-empty paragraph texts of a .docx."""
+    from docx import Document
+
+    return [p.text for p in Document(docx_file).paragraphs if p.text.strip()]
+
+
+def chunk_paragraphs(paragraphs, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+    """Yield chunks of whole paragraphs joined by newlines. A chunk is closed as soon as it
+    grows past size characters; the next one starts with the trailing paragraphs of the
+    previous chunk that fit within overlap characters, which must be less than size. Runs
+    in linear time."""
+    if overlap >= size:
+        raise ValueError(f"Chunk overlap ({overlap}) must be smaller than the chunk size ({size})")
+    current = []
+    length = 0  # len("\n".join(current)), tracked incrementally
+    fresh = False  # whether current holds anything beyond the overlap carried over
+    for text in paragraphs:
+        length += len(text) + (1 if current else 0)
+        current.append(text)
+        fresh = True
+        if length > size:
+            yield "\n".join(current)
+            carried, carried_length = [], -1
+            for prev in reversed(current):
+                if carried_length + len(prev) + 1 > overlap:
+                    break
+                carried.insert(0, prev)
+                carried_length += len(prev) + 1
+            current, length, fresh = carried, max(carried_length, 0), False
+    if current and fresh:
+        yield "\n".join(current)
+
+
+def _is_question(text: str) -> bool:
+    return text.endswith("?") or bool(_QUESTION_PREFIX_RE.match(text))
+
+
+def extract_faq_pairs(paragraphs):
+    """Return [(question, answer)] when the paragraphs are laid out as an FAQ: question
+    paragraphs (ending in "?" or starting with "Q:") each followed by their answer
+    paragraphs (an "A:" prefix is dropped). Returns [] for anything else, so ordinary policy
+    text with the odd question heading is not mistaken for an FAQ."""
+    pairs = []
+    questions = 0
+    question, answer = None, []
+    for text in paragraphs:
+        text = text.strip()
+        if _is_question(text):
+            if question and answer:
+                pairs.append((question, "\n".join(answer)))
+            questions += 1
+            question, answer = _QUESTION_PREFIX_RE.sub("", text), []
+        elif question is not None:
+            answer.append(_ANSWER_PREFIX_RE.sub("", text))
+    if question and answer:
+        pairs.append((question, "\n".join(answer)))
+    if (
+        len(pairs) < FAQ_MIN_PAIRS
+        or len(pairs) < questions * FAQ_ANSWERED_RATIO
+        or questions < len(paragraphs) * FAQ_MIN_QUESTION_SHARE
+    ):
+        return []
+    return pairs
+
+
+def _parse_file(docx_file: Path):
+    """Pool worker: returns (paragraphs, error)."""
+    try:
+        return read_paragraphs(docx_file), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _parse_missing(files, max_workers: Optional[int]):
+    """Yield _parse_file results for [(key, path)] in order, across a pool when worthwhile."""
+    if len(files) < PARALLEL_MIN_FILES or max_workers == 1:
+        for _, path in files:
+            yield _parse_file(path)
+        return
+    workers = min(max_workers or os.cpu_count() or 1, len(files))
+    # Spawned, not forked: builds run on background threads of processes that have
+    # chromadb loaded, and forking a multi-threaded process can deadlock the child
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        yield from pool.map(_parse_file, [path for _, path in files])
+
+
+def parse_files(
+    files,
+    size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True,
+):
+    """Parse and chunk [(key, path)] and yield (key, path, chunks, faq_pairs, error) in input
+    order as results become available. faq_pairs is extract_faq_pairs of the document. error
+    is a message (and chunks and faq_pairs None) when a file fails.
+    Paragraphs of unchanged files come from the document cache; the rest are parsed."""
+    files = list(files)
+    cache = DocumentCache() if use_cache else None
+    try:
+        cached = [cache.get(key, path) if cache else None for key, path in files]
+        missing = [f for f, paragraphs in zip(files, cached) if paragraphs is None]
+        parsed = _parse_missing(missing, max_workers)
+        for (key, path), paragraphs in zip(files, cached):
+            error = None
+            if paragraphs is None:
+                paragraphs, error = next(parsed)
+                if error is None and cache:
+                    cache.put(key, path, paragraphs)
+            if error is not None:
+                yield key, path, None, None, error
+                continue
+            yield key, path, list(chunk_paragraphs(paragraphs, size, overlap)), extract_faq_pairs(paragraphs), None
+    finally:
+        if cache:
+            cache.close()
+
+
+def iter_chunks(
+    data_dir: Path = DATA_DIR,
+    size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True,
+):
+    """Yield (text, source) for every chunk of every document, file by file."""
+    for _, docx_file, chunks, _, error in parse_files(scan_documents(data_dir), size, overlap, max_workers, use_cache):
+        if error is not None:
+            print(f"Error loading {docx_file}: {error}")
+            continue
+        for chunk in chunks:
+            yield chunk, docx_file.name
+
+
+def load_documents():
+    """Load all docx files from data folder."""
+    texts = []
+    sources = []
+    for text, source in iter_chunks():
+        texts.append(text)
+        sources.append(source)
+    return texts, sources
@@ -0,0 +1,92 @@
+"""Canned questions shown in the app. Kept out of app.py so build_db.py can precompute their answers."""
+
+# Topics with their questions - click topic to see questions, click question to get answer (3 per topic)
+TOPICS = {
+    "PTO": [
+        "How much PTO do I accrue each pay period?",
+        "Do unused PTO hours carry over to next year?",
+        "How do I request PTO and who needs to approve it?",
+        "How much sick leave do I receive and when can I use it?",
+    ],
+    "Holidays": [
+        "Which holidays are paid by the company?",
+        "What happens if a holiday falls on a weekend?",
+        "Do we get floating holidays, and how do I use them?",
+    ],
+    "Benefits": [
+        "When am I eligible for health insurance benefits?",
+        "How do I enroll or make changes to my benefits?",
+        "Does the company offer dental and vision coverage?",
+    ],
+    "New Hire": [
+        "How do I request time off as a new employee?",
+        "When do my benefits start and how do I enroll?",
+        "Who should I contact if I have questions during onboarding?",
+    ],
+    "Chemical Spill": [
+        "What should I do if a chemical spill occurs at work?",
+        "Who do I report a chemical spill to?",
+        "What safety equipment is required for chemical cleanup?",
+    ],
+    "Company Vehicle": [
+        "Who is eligible for a company vehicle?",
+        "What are the rules for using a company vehicle?",
+        "What should I do if I'm in an accident in a company vehicle?",
+    ],
+    "FMLA": [
+        "What is FMLA and who is eligible?",
+        "How do I request FMLA leave?",
+        "How much FMLA leave am I entitled to?",
+    ],
+    "Escalations": [
+        "How do I escalate an HR issue?",
+        "Who do I contact for HR escalations?",
+        "When should I escalate a concern to HR?",
+    ],
+    "Workplace Conduct": [
+        "What are the workplace conduct expectations?",
+        "How do I report harassment or discrimination?",
+        "What is the policy on workplace ethics?",
+    ],
+    "Remote Work": [
+        "Am I eligible to work remotely or hybrid?",
+        "What are the expected working hours for remote employees?",
+        "Does the company reimburse home office equipment?",
+    ],
+    "Reimbursement": [
+        "How do I submit expense reimbursements?",
+        "What expenses are reimbursable?",
+        "What is the reimbursement process and timeline?",
+    ],
+}
+
+# FAQ questions - click to search handbook and show answer
+FAQS = [
+    "What is the procedure if I am going to be late to work?",
+    "When am I eligible for benefits?",
+    "What happens if I forget to clock in or clock out?",
+    "Can I make up missed hours later in the week?",
+    "Do I need a doctor's note to return to work?",
+    "When am I eligible to start using my vacation time?",
+    "How much sick leave do I receive each year?",
+    "Do unused vacation or sick days carry over?",
+    "What do I do if I'm injured on the job?",
+    "How many vacation days do I get?",
+    "When does my health insurance coverage begin?",
+    "When can I change my insurance plans?",
+    "What happens to my benefits if I leave the company?",
+    "What holidays do I have off?",
+    "What should I do if I witness harassment or discrimination?",
+    "How do I report a safety concern?",
+    "When are we paid?",
+    "When am I eligible for the 401(k)?",
+    "Who is eligible to work remotely?",
+    "How is my performance evaluated when working from home?",
+]
+
+
+def canned_questions():
+    """Every topic and FAQ question, deduplicated, in display order."""
+    seen = dict.fromkeys(q for questions in TOPICS.values() for q in questions)
+    seen.update(dict.fromkeys(FAQS))
+    return list(seen)
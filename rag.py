@@ -1,153 +1,1264 @@
-"""Simple RAG for James Shield HR Assistant - answers only from handbook documents."""
+"""Simple RAG for James Shield HR Assistant - answers only from handbook documents.
 
+chromadb, openai and httpx are imported on first use (building the index or answering a
+question), so the app can import this module and render before paying for them."""
+
+import asyncio
+import contextlib
+import hashlib
+import json
 import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 
-from docx import Document
-from openai import OpenAI
-import chromadb
-from chromadb.utils import embedding_functions
+from answer_cache import AnswerCache
+from context import build_context
+from doc_cache import file_sha256
+from embeddings import EMBEDDING_PROVIDER, EmbeddingCache, QueryEmbeddingCache, approx_tokens, embed_texts, get_provider, provider_name
+from faq import FaqIndex
+from lexical import BM25Index, rrf_fuse
+from scheduler import BACKGROUND, INTERACTIVE, get_scheduler
+from telemetry import METRICS, NULL_TRACE, start_trace
+from vector_index import MATRIX_NAME, VECTOR_BACKEND, VectorIndex, export_vectors
+from loader import CHUNK_OVERLAP, CHUNK_SIZE, get_document_list, load_documents, parse_files, scan_documents
 
+CHROMA_PATH = Path(os.getenv("HR_CHROMA_DIR") or Path(__file__).parent / "chroma_db")
+# Each build writes a complete index version: collections named <name>_<version> and
+# a directory INDEX_DIR/<version> with the manifest and BM25 index
+COLLECTION_NAME = "handbook"
+# One centroid vector per document, used to route questions to the right documents
+DOCUMENT_COLLECTION_NAME = "handbook_documents"
+INDEX_DIR = CHROMA_PATH / "indexes"
+# Per-file fingerprints, per-chunk content hashes and FAQ pairs of what is in the version's
+# collection; MANIFEST_FORMAT changes when entries gain fields, forcing a full rebuild
+MANIFEST_NAME = "manifest.json"
+MANIFEST_FORMAT = 2
+# BM25 index over the same chunks as the version's collection
+LEXICAL_INDEX_NAME = "lexical_index.json"
+CHAT_MODEL = "gpt-4o-mini"
+# Completion tokens charged to the scheduler's token budget per answer (2-3 sentences)
+COMPLETION_TOKEN_BUDGET = 200
 
-def get_document_list():
-    """Return list of document names (without .docx) for filtering."""
-    data_dir = Path(__file__).parent / "data"
-    docs = set()
-    for folder in ["hr_docs", "hr_extra"]:
-        folder_path = data_dir / folder
-        if not folder_path.exists():
-            continue
-        for docx_file in folder_path.glob("*.docx"):
-            if docx_file.name.startswith("~$"):
-                continue
-            docs.add(docx_file.name)
-    return sorted(docs)
+# The active index version. build_vector_store replaces it atomically once a new version
+# is complete; engines compare it to know when to reload
+INDEX_VERSION_FILE = CHROMA_PATH / "index_version"
+ANSWER_CACHE_FILE = CHROMA_PATH / "answer_cache.sqlite3"
+# Answers to the canned FAQ/topic questions, generated after a build
+PRECOMPUTED_FILE = CHROMA_PATH / "precomputed_answers.json"
+# Chunk vectors by (embedder, text hash), so re-indexing unchanged text makes no API calls
+EMBEDDING_CACHE_FILE = CHROMA_PATH / "embedding_cache.sqlite3"
+# Held (flock) for the whole of a build, so builds in different processes never overlap
+BUILD_LOCK_FILE = CHROMA_PATH / "build.lock"
+# Files of the single, unversioned index written by older builds; removed on the next build
+LEGACY_INDEX_FILES = (CHROMA_PATH / "manifest.json", CHROMA_PATH / "lexical_index.json")
 
+# Hybrid retrieval: candidates from each retriever and fused candidates handed to
+# context.build_context, which trims them to what is relevant and fits the token budget
+VECTOR_K = 8
+LEXICAL_K = 8
+CANDIDATE_K = 10
+# Two-stage retrieval: once the corpus has ROUTING_MIN_DOCUMENTS documents, unfiltered
+# questions search chunks only within the ROUTE_DOCUMENTS closest documents
+ROUTING_MIN_DOCUMENTS = int(os.getenv("HR_ROUTING_MIN_DOCUMENTS", "50"))
+ROUTE_DOCUMENTS = int(os.getenv("HR_ROUTE_DOCUMENTS", "5"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("HR_ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("HR_ANSWER_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
 
-def load_documents():
-    """Load all docx files from data folder."""
-    data_dir = Path(__file__).parent / "data"
-    texts = []
-    sources = []
+FALLBACK_ANSWER = "The information you requested is confidential or privacy restricted. Please reach out to Human Resources directly for assistance."
 
-    for folder in ["hr_docs", "hr_extra"]:
-        folder_path = data_dir / folder
-        if not folder_path.exists():
-            continue
-        for docx_file in folder_path.glob("*.docx"):
-            if docx_file.name.startswith("~$"):
-                continue
+SYSTEM_PROMPT = """You are an HR assistant. Summarize the provided document context to answer the user's question.
+
+RULES:
+1. Use ONLY information from the provided context. Do NOT add, infer, or invent anything.
+2. If the context contains accrual rates, hours, amounts, or policy details that relate to the question - you MUST answer using that information. Do NOT use the fallback.
+3. If the context uses different terminology (e.g., "monthly" vs "pay period", "Vacation" vs "PTO"), present the information from the context. For accrual: if the handbook says "hours per month", provide those rates and note that PTO/vacation accrues monthly.
+4. ONLY if the context truly has NO relevant information, respond EXACTLY with: "The information you requested is confidential or privacy restricted. Please reach out to Human Resources directly for assistance."
+5. Summarize your answer to 2-3 sentences. Be concise but accurate."""
+
+# Part of the answer cache key, so editing the prompt never serves answers from the old one
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+def index_version() -> Optional[str]:
+    """Return the active index version, or None if the index was never built."""
+    try:
+        return INDEX_VERSION_FILE.read_text().strip() or None
+    except OSError:
+        return None
+
+
+def _activate_index_version(version: str):
+    """Point readers at version. A rename, so a reader sees either the old or the new one."""
+    CHROMA_PATH.mkdir(parents=True, exist_ok=True)
+    tmp = INDEX_VERSION_FILE.with_suffix(".tmp")
+    tmp.write_text(version)
+    os.replace(tmp, INDEX_VERSION_FILE)
+
+
+def _collection_name(version: str) -> str:
+    return f"{COLLECTION_NAME}_{version}"
+
+
+def _document_collection_name(version: str) -> str:
+    return f"{DOCUMENT_COLLECTION_NAME}_{version}"
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def _file_id(file_key: str) -> str:
+    return hashlib.sha1(file_key.encode("utf-8")).hexdigest()[:12]
+
+
+def _chunk_id(file_key: str, position: int) -> str:
+    """Stable chunk id: the same file and chunk position always map to the same id."""
+    return f"{_file_id(file_key)}_{position}"
+
+
+def _split_chunk_id(chunk_id: str):
+    """Return (file id, chunk position) for an id made by _chunk_id."""
+    file_id, position = chunk_id.rsplit("_", 1)
+    return file_id, int(position)
+
+
+def _load_manifest(version: Optional[str] = None) -> Optional[dict]:
+    """Manifest of version (default: the active one), or None if it is missing or was
+    built with a different embedder or chunking."""
+    version = version or index_version()
+    if version is None:
+        return None
+    try:
+        manifest = json.loads((INDEX_DIR / version / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return None
+    if (
+        manifest.get("format") != MANIFEST_FORMAT
+        or manifest.get("embedder") != provider_name()
+        or manifest.get("chunking") != [CHUNK_SIZE, CHUNK_OVERLAP]
+    ):
+        return None
+    return manifest
+
+
+def _document_vector(collection, file_key: str, chunk_count: int):
+    """Unit-length mean of a document's unit-length chunk vectors."""
+    import numpy as np
+
+    stored = collection.get(ids=[_chunk_id(file_key, i) for i in range(chunk_count)], include=["embeddings"])
+    vectors = np.asarray(stored["embeddings"], dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    centroid = vectors.mean(axis=0)
+    return (centroid / max(float(np.linalg.norm(centroid)), 1e-12)).tolist()
+
+
+def _copy_records(source, target, ids, include, batch_size: int = 1000):
+    """Copy records (with their stored embeddings) from one collection to another."""
+    for start in range(0, len(ids), batch_size):
+        stored = source.get(ids=ids[start:start + batch_size], include=["embeddings", *include])
+        target.add(ids=stored["ids"], embeddings=stored["embeddings"], **{field: stored[field] for field in include})
+
+
+def _copy_moved_records(source, target, moves, batch_size: int = 1000):
+    """Add [(new id, old id, text, metadata)] to target with the old records' vectors."""
+    for start in range(0, len(moves), batch_size):
+        batch = moves[start:start + batch_size]
+        stored = source.get(ids=list({old_id for _, old_id, _, _ in batch}), include=["embeddings"])
+        vectors = dict(zip(stored["ids"], stored["embeddings"]))
+        target.add(
+            ids=[new_id for new_id, _, _, _ in batch],
+            embeddings=[vectors[old_id] for _, old_id, _, _ in batch],
+            documents=[text for _, _, text, _ in batch],
+            metadatas=[meta for _, _, _, meta in batch],
+        )
+
+
+def _build_document_index(documents, collection, old_documents, files: dict, changed) -> int:
+    """Fill the routing collection with one centroid per document with chunks: copied from
+    old_documents when the document is unchanged, recomputed from collection otherwise.
+    Returns the number of centroids computed."""
+    expected = {_file_id(key): key for key, f in files.items() if f["chunks"]}
+    reusable = set()
+    if old_documents is not None:
+        reusable = set(old_documents.get(ids=list(expected), include=[])["ids"])
+    copy = [doc_id for doc_id, key in expected.items() if doc_id in reusable and key not in changed]
+    if copy:
+        _copy_records(old_documents, documents, copy, ["metadatas"])
+    todo = [(doc_id, key) for doc_id, key in expected.items() if doc_id not in reusable or key in changed]
+    for start in range(0, len(todo), 256):
+        batch = todo[start:start + 256]
+        documents.add(
+            ids=[doc_id for doc_id, _ in batch],
+            embeddings=[_document_vector(collection, key, len(files[key]["chunks"])) for _, key in batch],
+            metadatas=[
+                {"source": key.rsplit("/", 1)[-1], "file": key, "chunks": len(files[key]["chunks"])}
+                for _, key in batch
+            ],
+        )
+    return len(todo)
+
+
+def _export_vectors(collection, directory: Path, files: dict):
+    """Export the collection's vectors, in manifest order, for the numpy vector backend."""
+    ids = [_chunk_id(key, i) for key, f in files.items() for i in range(len(f["chunks"]))]
+    vectors, sources = {}, {}
+    for start in range(0, len(ids), 1000):
+        stored = collection.get(ids=ids[start:start + 1000], include=["embeddings", "metadatas"])
+        for chunk_id, vector, meta in zip(stored["ids"], stored["embeddings"], stored["metadatas"]):
+            vectors[chunk_id] = vector
+            sources[chunk_id] = meta["source"]
+    export_vectors(directory, ids, [sources[i] for i in ids], [vectors[i] for i in ids])
+
+
+def _validate_index(collection, documents, lexical, files: dict):
+    """Raise if a freshly built index version does not match its manifest."""
+    chunks = sum(len(f["chunks"]) for f in files.values())
+    documents_expected = sum(1 for f in files.values() if f["chunks"])
+    if collection.count() != chunks or len(lexical) != chunks:
+        raise RuntimeError(
+            f"New index has {collection.count()} vectors and {len(lexical)} keyword entries, expected {chunks}"
+        )
+    if documents.count() != documents_expected:
+        raise RuntimeError(f"New index routes {documents.count()} documents, expected {documents_expected}")
+    # A stored vector must find itself (or an identical chunk) through the HNSW index
+    probe = collection.get(limit=1, include=["embeddings"])
+    found = collection.query(query_embeddings=probe["embeddings"], n_results=1, include=["distances"])
+    if not found["distances"][0] or found["distances"][0][0] > 1e-3:
+        raise RuntimeError("New index failed its search check")
+
+
+def _drop_index_version(client, version: str):
+    for name in (_collection_name(version), _document_collection_name(version)):
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+    shutil.rmtree(INDEX_DIR / version, ignore_errors=True)
+
+
+def _collect_garbage(client, keep):
+    """Delete every index version (collections and files) not in keep, including the
+    unversioned index of older builds."""
+    keep_names = {name for version in keep for name in (_collection_name(version), _document_collection_name(version))}
+    for collection in client.list_collections():
+        name = getattr(collection, "name", collection)
+        if name.startswith(COLLECTION_NAME) and name not in keep_names:
+            client.delete_collection(name)
+    if INDEX_DIR.exists():
+        for path in INDEX_DIR.iterdir():
+            if path.name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+    for path in LEGACY_INDEX_FILES:
+        path.unlink(missing_ok=True)
+
+
+def index_summary() -> Optional[dict]:
+    """Document and chunk counts of the active index from its manifest, or None if the
+    index is missing or was built with different settings. Cheap: reads one JSON file."""
+    manifest = _load_manifest()
+    if manifest is None:
+        return None
+    return {
+        "documents": len(manifest["files"]),
+        "chunks": sum(len(f["chunks"]) for f in manifest["files"].values()),
+        "embedder": manifest["embedder"],
+    }
+
+
+def _write_json_atomic(path: Path, data):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def format_build_report(report: dict) -> str:
+    """One-line summary of a build_vector_store report."""
+    if not (report["added"] or report["updated"] or report["removed"]):
+        return f"Index up to date ({report['unchanged']} chunks, {report['seconds']:.2f}s)"
+    return (
+        f"Index updated: {report['added']} added, {report['updated']} updated, "
+        f"{report['removed']} removed, {report['unchanged']} unchanged "
+        f"({report['files_parsed']} files parsed, {report['seconds']:.2f}s)"
+    )
+
+
+_build_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _exclusive_build():
+    """Serialise builds within this process and, through BUILD_LOCK_FILE, with builds in
+    other processes (build_db.py, server.py, app sessions), whose half-built version the
+    garbage collection of this one would otherwise delete. Without fcntl (Windows) only
+    the in-process lock is taken."""
+    with _build_lock:
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        CHROMA_PATH.mkdir(parents=True, exist_ok=True)
+        with open(BUILD_LOCK_FILE, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
             try:
-                doc = Document(docx_file)
-                full_text = "\n".join(p.text for p in doc.paragraphs if p.text.strip())
-                if full_text:
-                    # Chunk by paragraphs (simple approach)
-                    chunks = []
-                    current = []
-                    for p in doc.paragraphs:
-                        if p.text.strip():
-                            current.append(p.text)
-                            if len("\n".join(current)) > 600:
-                                chunks.append("\n".join(current))
-                                current = []
-                    if current:
-                        chunks.append("\n".join(current))
-                    for chunk in chunks:
-                        texts.append(chunk)
-                        sources.append(docx_file.name)
-            except Exception as e:
-                print(f"Error loading {docx_file}: {e}")
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 
-    return texts, sources
+def build_vector_store(progress=None) -> dict:
+    """Sync the vector store with the documents in data/ by building a new index version.
 
+    Only files whose size/mtime and content hash changed are parsed. Vectors of unchanged
+    chunks and document centroids are copied from the active version; new chunk text is
+    embedded in batches by the configured embedding provider (see embeddings.embed_texts),
+    and progress(done, total) is called as embeddings complete. The new version is
+    validated, exported as a memory-mapped matrix for the numpy vector backend (see
+    vector_index), made active by atomically replacing INDEX_VERSION_FILE, and older versions
+    are then deleted except the one just replaced, which questions already in flight may
+    still be reading. Until the switch every reader keeps using the active version, so
+    answering never waits for a build and a failed build changes nothing.
 
-def build_vector_store():
-    """Build ChromaDB vector store from documents."""
-    texts, sources = load_documents()
-    if not texts:
+    An index built by a different provider (recorded in the manifest and the collection
+    metadata) is rebuilt from scratch. Returns a report with added/updated/removed/unchanged
+    chunk counts and the active version. Builds wait for each other, also across
+    processes."""
+    with _exclusive_build():
+        return _build_vector_store(progress)
+
+
+def _build_vector_store(progress) -> dict:
+    started = time.perf_counter()
+    provider = get_provider(api_key=os.getenv("OPENAI_API_KEY"))
+    metadata = {"hnsw:space": "cosine", "embedder": provider.name}
+
+    import chromadb
+
+    # Vectors are always supplied by the provider, so the collections have no embedding function
+    client = chromadb.PersistentClient(path=str(CHROMA_PATH))
+    active = index_version()
+    manifest = _load_manifest(active)
+    old_collection = old_documents = None
+    lexical = BM25Index()
+    if manifest is not None:
+        try:
+            old_collection = client.get_collection(_collection_name(active), embedding_function=None)
+            old_documents = client.get_collection(_document_collection_name(active), embedding_function=None)
+        except Exception:
+            old_collection = old_documents = None
+        lexical = BM25Index.load(INDEX_DIR / active / LEXICAL_INDEX_NAME)
+
+    # An active version that does not match its manifest (a different embedder, a missing
+    # collection, or the unversioned index of an older build) cannot be diffed - start over.
+    expected = sum(len(f["chunks"]) for f in manifest["files"].values()) if manifest else 0
+    if (
+        old_collection is None
+        or (old_collection.metadata or {}).get("embedder") != provider.name
+        or old_collection.count() != expected
+        or len(lexical) != expected
+    ):
+        old_collection = old_documents = None
+        manifest = {
+            "format": MANIFEST_FORMAT,
+            "embedder": provider.name,
+            "chunking": [CHUNK_SIZE, CHUNK_OVERLAP],
+            "files": {},
+        }
+        lexical = BM25Index()
+
+    report = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "files_parsed": 0, "documents_routed": 0}
+    old_files = manifest["files"]
+    new_files = {}
+    upsert_ids, upsert_docs, upsert_metas = [], [], []
+    reused = []  # (new id, old id with the same text, text, metadata): vector copied, not embedded
+    delete_ids = []
+
+    to_parse = []
+    changed_files = set()
+    for key, docx_file in scan_documents():
+        stat = docx_file.stat()
+        old = old_files.get(key)
+        if old and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+            new_files[key] = old
+            report["unchanged"] += len(old["chunks"])
+            continue
+        digest = file_sha256(docx_file)
+        if old and old["sha256"] == digest:
+            new_files[key] = {**old, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            report["unchanged"] += len(old["chunks"])
+            continue
+        to_parse.append((key, docx_file))
+        new_files[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+
+    # Chunk text hash -> an old chunk with that text, so text that only moved (a paragraph
+    # inserted above it, or moved to another file) keeps its vector
+    old_by_hash = {}
+    if to_parse:
+        for key, old in old_files.items():
+            for i, h in enumerate(old["chunks"]):
+                old_by_hash.setdefault(h, _chunk_id(key, i))
+
+    for key, docx_file, chunks, faq_pairs, error in parse_files(to_parse):
+        old = old_files.get(key)
+        if error is not None:
+            print(f"Error loading {docx_file}: {error}")
+            if old:
+                new_files[key] = old
+                report["unchanged"] += len(old["chunks"])
+            else:
+                del new_files[key]
+            continue
+        report["files_parsed"] += 1
+        changed_files.add(key)
+
+        old_hashes = old["chunks"] if old else []
+        hashes = [_text_hash(c) for c in chunks]
+        for i, (chunk, h) in enumerate(zip(chunks, hashes)):
+            if i < len(old_hashes) and old_hashes[i] == h:
+                report["unchanged"] += 1
+                continue
+            if h in old_by_hash:
+                report["unchanged"] += 1
+                reused.append((_chunk_id(key, i), old_by_hash[h], chunk, {"source": docx_file.name}))
+                continue
+            report["updated" if i < len(old_hashes) else "added"] += 1
+            upsert_ids.append(_chunk_id(key, i))
+            upsert_docs.append(chunk)
+            upsert_metas.append({"source": docx_file.name})
+        for i in range(len(chunks), len(old_hashes)):
+            delete_ids.append(_chunk_id(key, i))
+            report["removed"] += 1
+        new_files[key]["chunks"] = hashes
+        new_files[key]["faq"] = faq_pairs
+
+    for key, old in old_files.items():
+        if key not in new_files:
+            delete_ids.extend(_chunk_id(key, i) for i in range(len(old["chunks"])))
+            report["removed"] += len(old["chunks"])
+
+    if not any(f["chunks"] for f in new_files.values()):
         raise ValueError("No documents loaded")
 
-    client = chromadb.PersistentClient(path=str(Path(__file__).parent / "chroma_db"))
-    ef = embedding_functions.OpenAIEmbeddingFunction(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        model_name="text-embedding-3-small",
-    )
+    manifest["files"] = new_files
+    if old_collection is not None and not (upsert_ids or reused or delete_ids):
+        # Nothing to re-index; keep the active version and record any refreshed mtimes
+        _write_json_atomic(INDEX_DIR / active / MANIFEST_NAME, manifest)
+        if not (INDEX_DIR / active / MATRIX_NAME).exists():
+            _export_vectors(old_collection, INDEX_DIR / active, new_files)
+        report["version"] = active
+        report["seconds"] = time.perf_counter() - started
+        return report
 
+    version = str(time.time_ns())
     try:
-        client.delete_collection("handbook")
-    except Exception:
-        pass
-
-    collection = client.create_collection(
-        name="handbook",
-        embedding_function=ef,
-        metadata={"hnsw:space": "cosine"},
-    )
+        collection = client.create_collection(name=_collection_name(version), embedding_function=None, metadata=metadata)
+        if old_collection is not None:
+            fresh = set(upsert_ids) | {new_id for new_id, *_ in reused}
+            keep_ids = [
+                chunk_id
+                for key, f in new_files.items()
+                for chunk_id in (_chunk_id(key, i) for i in range(len(f["chunks"])))
+                if chunk_id not in fresh
+            ]
+            _copy_records(old_collection, collection, keep_ids, ["documents", "metadatas"])
+            _copy_moved_records(old_collection, collection, reused)
+        if upsert_ids:
+            schedule = None
+            if provider.remote:
+                scheduler = get_scheduler()
 
-    collection.add(
-        documents=texts,
-        ids=[f"doc_{i}" for i in range(len(texts))],
-        metadatas=[{"source": s} for s in sources],
-    )
-    return collection
+                def schedule(fn, tokens):
+                    return scheduler.call(fn, tokens, priority=BACKGROUND, kind="embedding")
 
+            cache = EmbeddingCache(EMBEDDING_CACHE_FILE)
+            try:
+                vectors = embed_texts(upsert_docs, provider, cache=cache, progress=progress, schedule=schedule)
+            finally:
+                cache.close()
+            collection.add(ids=upsert_ids, documents=upsert_docs, metadatas=upsert_metas, embeddings=vectors)
+        documents = client.create_collection(
+            name=_document_collection_name(version), embedding_function=None, metadata=metadata
+        )
+        report["documents_routed"] = _build_document_index(documents, collection, old_documents, new_files, changed_files)
 
-def get_answer(question: str, document_filter: Optional[str] = None) -> str:
-    """Get RAG answer - only from handbook, summarize to 2 sentences.
-    If document_filter is provided (e.g. 'Vacation Policy.docx'), search only that document."""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return "Error: OPENAI_API_KEY not set. Please add it to .env file."
-
-    client = chromadb.PersistentClient(path=str(Path(__file__).parent / "chroma_db"))
-    ef = embedding_functions.OpenAIEmbeddingFunction(
-        api_key=api_key,
-        model_name="text-embedding-3-small",
+        for chunk_id in delete_ids:
+            lexical.remove(chunk_id)
+        for chunk_id, doc, meta in zip(upsert_ids, upsert_docs, upsert_metas):
+            lexical.add(chunk_id, doc, meta["source"])
+        for chunk_id, _, doc, meta in reused:
+            lexical.add(chunk_id, doc, meta["source"])
+        _validate_index(collection, documents, lexical, new_files)
+
+        (INDEX_DIR / version).mkdir(parents=True, exist_ok=True)
+        lexical.save(INDEX_DIR / version / LEXICAL_INDEX_NAME)
+        _export_vectors(collection, INDEX_DIR / version, new_files)
+        manifest["previous"] = active
+        _write_json_atomic(INDEX_DIR / version / MANIFEST_NAME, manifest)
+    except BaseException:
+        _drop_index_version(client, version)
+        raise
+
+    _activate_index_version(version)
+    cache = open_answer_cache()
+    cache.invalidate(version)
+    cache.close()
+    _collect_garbage(client, {version, active} - {None})
+
+    report["version"] = version
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+def open_answer_cache() -> AnswerCache:
+    return AnswerCache(
+        ANSWER_CACHE_FILE,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
     )
 
-    try:
-        collection = client.get_collection(name="handbook", embedding_function=ef)
-    except Exception:
-        collection = build_vector_store()
 
-    # For PTO/accrual questions, add related terms to improve retrieval (handbook uses "Vacation" and "monthly")
-    query_text = question
-    if any(term in question.lower() for term in ["pto", "accrual", "accrue", "pay period"]):
-        query_text = f"{question} vacation accrual monthly hours"
-    query_kwargs = {"query_texts": [query_text], "n_results": 10}
-    if document_filter:
-        query_kwargs["where"] = {"source": document_filter}
+def _chat_tokens(messages) -> int:
+    """Tokens a completion is charged against the scheduler's budget: prompt plus answer."""
+    return sum(approx_tokens(m["content"]) for m in messages) + COMPLETION_TOKEN_BUDGET
 
-    results = collection.query(**query_kwargs)
 
-    if not results or not results["documents"] or not results["documents"][0]:
-        return "The information you requested is confidential or privacy restricted. Please reach out to Human Resources directly for assistance."
+def _hit(chunk_id: str, text: str, source: str, distance: Optional[float]) -> dict:
+    file_id, position = _split_chunk_id(chunk_id)
+    return {
+        "id": chunk_id,
+        "text": text,
+        "source": source,
+        "file": file_id,
+        "position": position,
+        "distance": distance,
+    }
 
-    context = "\n\n---\n\n".join(results["documents"][0])
 
-    openai_client = OpenAI(api_key=api_key)
-    response = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": """You are an HR assistant. Summarize the provided document context to answer the user's question.
+@dataclass
+class AnswerResult:
+    """Outcome of one question in a batch: answer is set on success, error on failure.
+    faq is set when the answer was taken from an FAQ document without a completion."""
 
-RULES:
-1. Use ONLY information from the provided context. Do NOT add, infer, or invent anything.
-2. If the context contains accrual rates, hours, amounts, or policy details that relate to the question - you MUST answer using that information. Do NOT use the fallback.
-3. If the context uses different terminology (e.g., "monthly" vs "pay period", "Vacation" vs "PTO"), present the information from the context. For accrual: if the handbook says "hours per month", provide those rates and note that PTO/vacation accrues monthly.
-4. ONLY if the context truly has NO relevant information, respond EXACTLY with: "The information you requested is confidential or privacy restricted. Please reach out to Human Resources directly for assistance."
-5. Summarize your answer to 2-3 sentences. Be concise but accurate.""",
-            },
+    question: str
+    document_filter: Optional[str] = None
+    answer: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+    faq: bool = False
+
+
+class HandbookRAG:
+    """Long-lived RAG engine. Owns the Chroma client, collection, embedding provider, a
+    query-embedding cache and a pooled OpenAI client so each question only pays for
+    retrieval and the completion.
+
+    Safe to share between threads (e.g. Streamlit sessions). The collection is reopened
+    automatically when build_vector_store writes a new index version."""
+
+    def __init__(self, api_key: Optional[str] = None, use_cache: bool = True, vector_backend: Optional[str] = None):
+        self.vector_backend = (vector_backend or VECTOR_BACKEND).lower()
+        if self.vector_backend not in ("chroma", "numpy"):
+            raise ValueError(f"Unknown HR_VECTOR_BACKEND {self.vector_backend!r} (expected chroma or numpy)")
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.cache = open_answer_cache() if use_cache else None
+        self._lock = threading.RLock()
+        self._client = None
+        self._collection = None
+        self._documents = None
+        self._document_count = 0
+        self._vectors = None
+        self._lexical = None
+        self._faq = FaqIndex()
+        self._loaded_version = None
+        self._http_client = None
+        self._openai = None
+        self._async_clients = {}  # event loop -> pooled AsyncOpenAI
+        self._async_users = {}  # event loop -> aanswer_many calls running on it
+        self._embedder = None
+        self.query_cache = QueryEmbeddingCache()
+        self._context_totals = {"requests": 0, "context_tokens": 0, "tokens_saved": 0}
+
+    def _open_collections(self, version: Optional[str]):
+        if version is None:
+            return False
+        try:
+            self._collection = self._client.get_collection(name=_collection_name(version), embedding_function=None)
+            self._documents = self._client.get_collection(name=_document_collection_name(version), embedding_function=None)
+        except Exception:
+            return False
+        return (self._collection.metadata or {}).get("embedder") == provider_name()
+
+    def _load(self):
+        """Open the collections of the active index version, building the index first if it
+        does not exist or was built by a different embedding provider."""
+        if self._client is None:
+            import chromadb
+
+            self._client = chromadb.PersistentClient(path=str(CHROMA_PATH))
+        version = index_version()
+        if not self._open_collections(version):
+            version = build_vector_store()["version"]
+            self._open_collections(version)
+        self._document_count = self._documents.count()
+        self._lexical = BM25Index.load(INDEX_DIR / version / LEXICAL_INDEX_NAME)
+        self._vectors = None
+        if self.vector_backend == "numpy":
+            self._vectors = VectorIndex.load(INDEX_DIR / version)
+            if self._vectors is None:
+                print(f"Vector matrix of index {version} missing; searching Chroma until the next build")
+        manifest = _load_manifest(version) or {"files": {}}
+        self._faq = FaqIndex(
+            (question, answer, key.rsplit("/", 1)[-1])
+            for key, f in manifest["files"].items()
+            for question, answer in f.get("faq", ())
+        )
+        self._loaded_version = version
+
+    def collection(self):
+        """Return the open collection, reloading it if the index was rebuilt."""
+        with self._lock:
+            if self._collection is None or self._loaded_version != index_version():
+                self._load()
+            return self._collection
+
+    def reload(self):
+        """Drop the open collection so the next question reopens the current index."""
+        with self._lock:
+            self._collection = None
+            self._loaded_version = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._collection is not None
+
+    @property
+    def loaded_version(self) -> Optional[str]:
+        """Index version of the open collection."""
+        return self._loaded_version
+
+    def openai_client(self):
+        with self._lock:
+            if self._openai is None:
+                import httpx
+                from openai import OpenAI
+
+                self._http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                    timeout=httpx.Timeout(60.0, connect=10.0),
+                )
+                # Retries are left to the scheduler, which spaces them out across sessions
+                self._openai = OpenAI(api_key=self.api_key, http_client=self._http_client, max_retries=0)
+            return self._openai
+
+    def embedder(self):
+        """The configured embedding provider; OpenAI embeddings share the pooled client, and
+        the local and hashing providers need no API key."""
+        with self._lock:
+            if self._embedder is None:
+                client = self.openai_client() if EMBEDDING_PROVIDER == "openai" else None
+                self._embedder = get_provider(api_key=self.api_key, client=client)
+            return self._embedder
+
+    def close(self):
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            self._openai = None
+            for loop, client in self._async_clients.items():
+                if loop.is_running():
+                    asyncio.run_coroutine_threadsafe(client.close(), loop)
+                elif not loop.is_closed():
+                    loop.run_until_complete(client.close())
+            self._async_clients = {}
+            self._embedder = None
+            self._collection = None
+            self._client = None
+            if self.cache is not None:
+                self.cache.close()
+                self.cache = None
+
+    def _cache_lookup(self, question: str, document_filter: Optional[str], trace=NULL_TRACE):
+        """Return (cache_key, index_version, cached_answer); the key is None when caching is off."""
+        if self.cache is None:
+            trace.set(cache="off")
+            return None, None, None
+        version = self._loaded_version
+        key = AnswerCache.make_key(question, document_filter, CHAT_MODEL, PROMPT_VERSION, version)
+        with trace.stage("cache_lookup"):
+            cached = self.cache.get(key)
+        trace.set(cache="miss" if cached is None else "hit")
+        return key, version, cached
+
+    def _faq_answer(self, question: str, document_filter: Optional[str], trace=NULL_TRACE) -> Optional[str]:
+        """The stored answer of a closely matching FAQ question, or None."""
+        if not len(self._faq):
+            return None
+        with trace.stage("faq_match"):
+            match = self._faq.match(question, source=document_filter)
+        if match is None:
+            return None
+        METRICS.inc("hr_faq_answers_total")
+        trace.set(answer_source="faq", faq_question=match.question, faq_score=round(match.score, 3))
+        return match.answer
+
+    def _open(self, trace):
+        with trace.stage("open_index"):
+            self.collection()
+        trace.set(index_version=self._loaded_version)
+
+    def _embed_queries(self, questions, priority: int = INTERACTIVE, trace=NULL_TRACE):
+        """Embed questions, reusing vectors from the query-embedding cache. Returns the
+        vectors in order and how many came from the cache."""
+        texts = [q.strip() for q in questions]
+        vectors = [self.query_cache.get(t) for t in texts]
+        missing = sorted({t for t, v in zip(texts, vectors) if v is None})
+        if missing:
+            embedder = self.embedder()
+            if embedder.remote:
+                tokens = sum(approx_tokens(t) for t in missing)
+                new_vectors = get_scheduler().call(lambda: embedder.embed(missing), tokens, priority, "embedding", trace)
+            else:
+                new_vectors = embedder.embed(missing)
+            embedded = dict(zip(missing, new_vectors))
+            for text, vector in embedded.items():
+                self.query_cache.put(text, vector)
+            vectors = [embedded[t] if v is None else v for t, v in zip(texts, vectors)]
+        return vectors, len(texts) - sum(1 for t in texts if t in missing)
+
+    def _embed_query(self, question: str, trace=NULL_TRACE):
+        vectors, hits = self._embed_queries([question], trace=trace)
+        trace.set(query_embedding="hit" if hits else "miss")
+        return vectors[0]
+
+    def _route(self, documents, query_embeddings):
+        """Return the ROUTE_DOCUMENTS documents closest to each query vector as sorted
+        (file key, chunk count) tuples, or None when the corpus is too small for routing."""
+        if documents is None or self._document_count < ROUTING_MIN_DOCUMENTS:
+            return None
+        results = documents.query(
+            query_embeddings=query_embeddings,
+            n_results=ROUTE_DOCUMENTS,
+            include=["metadatas"],
+        )
+        return [tuple(sorted((meta["file"], meta["chunks"]) for meta in metas)) for metas in results["metadatas"]]
+
+    @staticmethod
+    def _routed_hits(collection, routed, query_embeddings):
+        """Exact cosine search over the chunks of the routed documents; returns one hit list
+        per query vector. Fetching a few documents' vectors and scoring them here is cheaper
+        than a metadata-filtered Chroma query and does not grow with the corpus."""
+        import numpy as np
+
+        ids = [_chunk_id(key, i) for key, count in routed for i in range(count)]
+        stored = collection.get(ids=ids, include=["embeddings", "documents", "metadatas"])
+        if not stored["ids"]:
+            return [[] for _ in query_embeddings]
+        vectors = np.asarray(stored["embeddings"], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        distances = 1.0 - queries @ vectors.T
+
+        per_query = []
+        for row in distances:
+            top = np.argsort(row)[:VECTOR_K]
+            per_query.append([
+                _hit(stored["ids"][j], stored["documents"][j], stored["metadatas"][j]["source"], float(row[j]))
+                for j in top
+            ])
+        return per_query
+
+    def _vector_hits(self, document_filter: Optional[str], query_embeddings, trace=NULL_TRACE):
+        """Vector hits for several query vectors; returns one hit list per vector.
+
+        With the numpy backend all vectors are scored in process against the exported
+        matrix. Otherwise, with a document_filter all vectors share one Chroma query, and
+        without one, on a large corpus each question is first routed to its closest
+        documents and only their chunks are searched (questions routed to the same documents
+        are scored together)."""
+        with self._lock:
+            collection = self.collection()
+            documents = self._documents
+            vectors = self._vectors
+            lexical = self._lexical
+        if vectors is not None:
+            return [
+                [_hit(chunk_id, *lexical.docs[chunk_id], distance) for chunk_id, distance in results]
+                for results in vectors.search(query_embeddings, VECTOR_K, source=document_filter)
+            ]
+        if document_filter:
+            return self._query_chunks(collection, {"source": document_filter}, query_embeddings)
+        with trace.stage("route"):
+            routes = self._route(documents, query_embeddings)
+        if routes is None:
+            return self._query_chunks(collection, None, query_embeddings)
+        trace.set(routed_documents=[key for key, _ in routes[0]])
+
+        per_query = [None] * len(query_embeddings)
+        groups = {}
+        for i, routed in enumerate(routes):
+            groups.setdefault(routed, []).append(i)
+        for routed, positions in groups.items():
+            for i, hits in zip(positions, self._routed_hits(collection, routed, [query_embeddings[i] for i in positions])):
+                per_query[i] = hits
+        return per_query
+
+    @staticmethod
+    def _query_chunks(collection, where: Optional[dict], query_embeddings):
+        """Run one Chroma query for several query vectors; returns one hit list per vector."""
+        query_kwargs = {"query_embeddings": query_embeddings, "n_results": VECTOR_K}
+        if where:
+            query_kwargs["where"] = where
+        results = collection.query(**query_kwargs)
+
+        per_query = []
+        for i in range(len(query_embeddings)):
+            if not results or not results["ids"] or i >= len(results["ids"]):
+                per_query.append([])
+                continue
+            per_query.append([
+                _hit(chunk_id, text, meta["source"], distance)
+                for chunk_id, text, meta, distance in zip(
+                    results["ids"][i], results["documents"][i], results["metadatas"][i], results["distances"][i]
+                )
+            ])
+        return per_query
+
+    def _fuse(self, question: str, document_filter: Optional[str], vector_hits):
+        """Merge vector hits with BM25 hits for the same question by reciprocal-rank fusion."""
+        hits = {hit["id"]: hit for hit in vector_hits}
+        lexical_ids = []
+        for chunk_id, _ in self._lexical.search(question, LEXICAL_K, source=document_filter):
+            if chunk_id not in hits:
+                text, source = self._lexical.docs[chunk_id]
+                hits[chunk_id] = _hit(chunk_id, text, source, None)
+            lexical_ids.append(chunk_id)
+        fused = rrf_fuse([[hit["id"] for hit in vector_hits], lexical_ids])
+        return [hits[chunk_id] for chunk_id in fused[:CANDIDATE_K]]
+
+    def retrieve(self, question: str, document_filter: Optional[str] = None, trace=NULL_TRACE):
+        """Hybrid retrieval: vector and BM25 candidates merged by reciprocal-rank fusion.
+        Returns up to CANDIDATE_K hits, best first, as dicts with id, text, source, file,
+        position and distance (None for keyword-only hits)."""
+        with trace.stage("embed_query"):
+            vector = self._embed_query(question, trace)
+        with trace.stage("vector_search"):
+            vector_hits = self._vector_hits(document_filter, [vector], trace)[0]
+        with trace.stage("lexical_search"):
+            hits = self._fuse(question, document_filter, vector_hits)
+        trace.set(candidates=len(hits))
+        return hits
+
+    def _record_context(self, stats: dict):
+        with self._lock:
+            self._context_totals["requests"] += 1
+            self._context_totals["context_tokens"] += stats["context_tokens"]
+            self._context_totals["tokens_saved"] += stats["tokens_saved"]
+
+    def context_stats(self) -> dict:
+        """Prompt context totals since start: requests, context tokens sent and tokens saved
+        by context.build_context versus sending every retrieved candidate."""
+        with self._lock:
+            totals = dict(self._context_totals)
+        requests = totals["requests"] or 1
+        totals["avg_context_tokens"] = totals["context_tokens"] / requests
+        totals["avg_tokens_saved"] = totals["tokens_saved"] / requests
+        return totals
+
+    def _messages_for(self, question: str, hits, trace=NULL_TRACE):
+        """Build the chat messages from retrieved hits, or None if nothing was retrieved."""
+        if not hits:
+            return None
+
+        with trace.stage("context"):
+            context, stats = build_context(hits)
+        self._record_context(stats)
+        trace.set(
+            chunks=stats["chunks_used"],
+            context_tokens=stats["context_tokens"],
+            tokens_saved=stats["tokens_saved"],
+        )
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
             {
                 "role": "user",
                 "content": f"Context from handbook:\n\n{context}\n\nQuestion: {question}",
             },
-        ],
-        temperature=0.1,
-    )
+        ]
+
+    def answer(self, question: str, document_filter: Optional[str] = None, trace=None) -> str:
+        """Get RAG answer - only from handbook, summarize to 2 sentences.
+        If document_filter is provided (e.g. 'Vacation Policy.docx'), search only that document.
+        A question that closely matches one in an FAQ document gets that FAQ's answer as-is,
+        without a completion (the trace records answer_source="faq").
+        Pass a telemetry.Trace to collect the stage breakdown; one is started automatically
+        when HR_TRACE is on."""
+        if trace is None:
+            trace = start_trace(question, document_filter)
+        try:
+            return self._answer(question, document_filter, trace)
+        except Exception as e:
+            trace.set(error=str(e))
+            raise
+        finally:
+            trace.finish()
+
+    def _answer(self, question: str, document_filter: Optional[str], trace) -> str:
+        if not self.api_key:
+            return "Error: OPENAI_API_KEY not set. Please add it to .env file."
+
+        self._open(trace)
+        cache_key, version, cached = self._cache_lookup(question, document_filter, trace)
+        if cached is not None:
+            return cached
+        answer = self._faq_answer(question, document_filter, trace)
+        if answer is not None:
+            return answer
+
+        messages = self._messages_for(question, self.retrieve(question, document_filter, trace), trace)
+        if messages is None:
+            answer = FALLBACK_ANSWER
+        else:
+            client = self.openai_client()
+
+            def _complete():
+                # Timed once admitted, so the scheduler wait is only counted as llm_queue
+                with trace.stage("completion"):
+                    return client.chat.completions.create(model=CHAT_MODEL, messages=messages, temperature=0.1)
+
+            response = get_scheduler().call(_complete, _chat_tokens(messages), trace=trace)
+            answer = response.choices[0].message.content.strip()
+            if response.usage is not None:
+                trace.set(
+                    prompt_tokens=response.usage.prompt_tokens,
+                    completion_tokens=response.usage.completion_tokens,
+                )
+
+        if cache_key is not None:
+            self.cache.put(cache_key, answer, version)
+        return answer
+
+    def stream_answer(self, question: str, document_filter: Optional[str] = None, trace=None):
+        """Like answer(), but yield the answer text in pieces as the completion streams in.
+        Cached and fallback answers are yielded in one piece. The complete answer is cached."""
+        if trace is None:
+            trace = start_trace(question, document_filter)
+        try:
+            yield from self._stream_answer(question, document_filter, trace)
+        except Exception as e:
+            trace.set(error=str(e))
+            raise
+        finally:
+            trace.finish()
+
+    def _stream_answer(self, question: str, document_filter: Optional[str], trace):
+        if not self.api_key:
+            yield "Error: OPENAI_API_KEY not set. Please add it to .env file."
+            return
+
+        self._open(trace)
+        cache_key, version, cached = self._cache_lookup(question, document_filter, trace)
+        if cached is not None:
+            yield cached
+            return
+        answer = self._faq_answer(question, document_filter, trace)
+        if answer is not None:
+            yield answer
+            return
+
+        messages = self._messages_for(question, self.retrieve(question, document_filter, trace), trace)
+        if messages is None:
+            parts = [FALLBACK_ANSWER]
+            yield FALLBACK_ANSWER
+        else:
+            client = self.openai_client()
+            started = None
+
+            def _open():
+                nonlocal started
+                started = time.perf_counter()
+                return client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=messages,
+                    temperature=0.1,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
 
-    answer = response.choices[0].message.content.strip()
-    return answer
+            stream = get_scheduler().stream(_open, _chat_tokens(messages), trace=trace)
+            parts = []
+            for chunk in stream:
+                if chunk.usage is not None:
+                    trace.set(
+                        prompt_tokens=chunk.usage.prompt_tokens,
+                        completion_tokens=chunk.usage.completion_tokens,
+                    )
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    # Skip leading whitespace so the streamed text matches answer().strip()
+                    if not parts:
+                        delta = delta.lstrip()
+                        if not delta:
+                            continue
+                        trace.add_stage("first_token", time.perf_counter() - started)
+                    parts.append(delta)
+                    yield delta
+            trace.add_stage("completion", time.perf_counter() - started)
+
+        if cache_key is not None:
+            self.cache.put(cache_key, "".join(parts).strip(), version)
+
+    def async_openai_client(self):
+        """Pooled async client for the running event loop. Async clients cannot be shared
+        between loops, so each loop gets its own; aanswer_many closes it when the last call
+        running on that loop finishes, before asyncio.run can close the loop under it."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                import httpx
+                from openai import AsyncOpenAI
+
+                client = AsyncOpenAI(
+                    api_key=self.api_key,
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(
+                        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                        timeout=httpx.Timeout(60.0, connect=10.0),
+                    ),
+                )
+                self._async_clients[loop] = client
+            return client
+
+    @contextlib.asynccontextmanager
+    async def _async_client_scope(self):
+        """Counts the calls using the running loop's client and closes it after the last."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._async_users[loop] = self._async_users.get(loop, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._async_users[loop] -= 1
+                client = None
+                if not self._async_users[loop]:
+                    del self._async_users[loop]
+                    client = self._async_clients.pop(loop, None)
+            if client is not None:
+                await client.close()
+
+    async def _acomplete(self, messages, trace=NULL_TRACE, priority: int = INTERACTIVE) -> str:
+        client = self.async_openai_client()
+
+        async def _complete():
+            with trace.stage("completion"):
+                return await client.chat.completions.create(model=CHAT_MODEL, messages=messages, temperature=0.1)
+
+        response = await get_scheduler().acall(_complete, _chat_tokens(messages), priority, trace=trace)
+        if response.usage is not None:
+            trace.set(
+                prompt_tokens=response.usage.prompt_tokens,
+                completion_tokens=response.usage.completion_tokens,
+            )
+        return response.choices[0].message.content.strip()
+
+    async def aanswer(self, question: str, document_filter: Optional[str] = None) -> str:
+        """Async version of answer(). Chroma runs in a worker thread; the completion uses
+        the async OpenAI client."""
+        result = (await self.aanswer_many([(question, document_filter)]))[0]
+        if result.error is not None:
+            raise RuntimeError(result.error)
+        return result.answer
+
+    async def aanswer_many(self, questions, concurrency: int = 8, priority: int = INTERACTIVE):
+        """Answer many questions at once. Each item is a question or a (question,
+        document_filter) pair. Uncached questions are embedded in a single call, vector
+        lookups for the same filter run as one Chroma query, and at most concurrency
+        completions are in flight. OpenAI calls are scheduled with priority (BACKGROUND
+        for precomputation). Returns AnswerResults in input order; a failure only affects
+        its own item."""
+        items = [(q, None) if isinstance(q, str) else (q[0], q[1]) for q in questions]
+        results = [AnswerResult(question=q, document_filter=f) for q, f in items]
+        if not items:
+            return results
+        if not self.api_key:
+            for result in results:
+                result.error = "OPENAI_API_KEY not set"
+            return results
+
+        traces = [start_trace(q, f) for q, f in items]
+        try:
+            async with self._async_client_scope():
+                await self._aanswer_many(items, results, traces, concurrency, priority)
+        finally:
+            for result, trace in zip(results, traces):
+                trace.set(batch=True)
+                if result.error is not None:
+                    trace.set(error=result.error)
+                trace.finish()
+        return results
+
+    async def _aanswer_many(self, items, results, traces, concurrency: int, priority: int):
+        started = time.perf_counter()
+        await asyncio.to_thread(self.collection)
+        for trace in traces:
+            trace.add_stage("open_index", time.perf_counter() - started)
+            trace.set(index_version=self._loaded_version)
+
+        pending = []
+        for i, (question, document_filter) in enumerate(items):
+            cache_key, version, cached = self._cache_lookup(question, document_filter, traces[i])
+            if cached is not None:
+                results[i].answer = cached
+                results[i].cached = True
+                continue
+            answer = self._faq_answer(question, document_filter, traces[i])
+            if answer is not None:
+                results[i].answer = answer
+                results[i].faq = True
+            else:
+                pending.append((i, cache_key, version))
+        if not pending:
+            return
+
+        started = time.perf_counter()
+        try:
+            vectors, _ = await asyncio.to_thread(self._embed_queries, [items[i][0] for i, _, _ in pending], priority)
+        except Exception as e:
+            for i, _, _ in pending:
+                results[i].error = f"Embedding failed: {e}"
+            return
+        for i, _, _ in pending:
+            traces[i].add_stage("embed_query", time.perf_counter() - started)
+
+        by_filter = {}
+        for (i, _, _), vector in zip(pending, vectors):
+            by_filter.setdefault(items[i][1], []).append((i, vector))
+
+        hits_by_item = {}
+
+        async def _lookup(document_filter, group):
+            started = time.perf_counter()
+            try:
+                per_query = await asyncio.to_thread(self._vector_hits, document_filter, [v for _, v in group])
+            except Exception as e:
+                for i, _ in group:
+                    results[i].error = f"Retrieval failed: {e}"
+                return
+            for (i, _), vector_hits in zip(group, per_query):
+                traces[i].add_stage("vector_search", time.perf_counter() - started)
+                with traces[i].stage("lexical_search"):
+                    hits_by_item[i] = self._fuse(items[i][0], document_filter, vector_hits)
+                traces[i].set(candidates=len(hits_by_item[i]))
+
+        await asyncio.gather(*(_lookup(f, group) for f, group in by_filter.items()))
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _complete(i, cache_key, version):
+            if i not in hits_by_item:
+                return
+            try:
+                messages = self._messages_for(items[i][0], hits_by_item[i], traces[i])
+                if messages is None:
+                    answer = FALLBACK_ANSWER
+                else:
+                    async with semaphore:
+                        answer = await self._acomplete(messages, traces[i], priority)
+            except Exception as e:
+                results[i].error = str(e)
+                return
+            results[i].answer = answer
+            if cache_key is not None:
+                self.cache.put(cache_key, answer, version)
+
+        await asyncio.gather(*(_complete(*p) for p in pending))
+
+    def answer_many(self, questions, concurrency: int = 8, priority: int = INTERACTIVE):
+        """Blocking wrapper around aanswer_many for scripts."""
+        return asyncio.run(self.aanswer_many(questions, concurrency=concurrency, priority=priority))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> HandbookRAG:
+    """Return the process-wide engine used by get_answer."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = HandbookRAG()
+        return _engine
+
+
+def get_answer(question: str, document_filter: Optional[str] = None) -> str:
+    """Get RAG answer - only from handbook, summarize to 2 sentences.
+    If document_filter is provided (e.g. 'Vacation Policy.docx'), search only that document."""
+    return get_engine().answer(question, document_filter)
+
+
+def stream_answer(question: str, document_filter: Optional[str] = None):
+    """Generator version of get_answer that yields the answer as it is generated."""
+    yield from get_engine().stream_answer(question, document_filter)
+
+
+async def aget_answer(question: str, document_filter: Optional[str] = None) -> str:
+    """Async version of get_answer."""
+    return await get_engine().aanswer(question, document_filter)
+
+
+def answer_many(questions, concurrency: int = 8):
+    """Answer a list of questions (or (question, document_filter) pairs) in one batch.
+    Returns AnswerResults in input order; see HandbookRAG.aanswer_many."""
+    return get_engine().answer_many(questions, concurrency=concurrency)
+
+
+def precompute_answers(questions, max_workers: int = 4) -> dict:
+    """Answer every question in one batch with at most max_workers completions in flight
+    and save the results as a versioned artifact for load_precomputed_answers.
+    Returns a report with answered/failed counts."""
+    engine = get_engine()
+    if not engine.api_key:
+        raise ValueError("OPENAI_API_KEY not set")
+    started = time.perf_counter()
+    engine.collection()
+    version = engine.loaded_version
+
+    results = engine.answer_many(questions, concurrency=max_workers, priority=BACKGROUND)
+    for result in results:
+        if result.error is not None:
+            print(f"Error precomputing answer for {result.question!r}: {result.error}")
+    answers = {r.question: r.answer for r in results if r.error is None}
+
+    _write_json_atomic(PRECOMPUTED_FILE, {
+        "index_version": version,
+        "prompt_version": PROMPT_VERSION,
+        "model": CHAT_MODEL,
+        "answers": answers,
+    })
+    return {
+        "answered": len(answers),
+        "failed": len(results) - len(answers),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def load_precomputed_answers() -> dict:
+    """Return {question: answer} from the precomputed artifact, or {} if it is missing or
+    was generated for a different index, prompt or model."""
+    try:
+        artifact = json.loads(PRECOMPUTED_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+    current = (index_version(), PROMPT_VERSION, CHAT_MODEL)
+    if (artifact.get("index_version"), artifact.get("prompt_version"), artifact.get("model")) != current:
+        return {}
+    return artifact.get("answers", {})
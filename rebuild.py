@@ -0,0 +1,78 @@
+"""Background index rebuilds.
+
+build_vector_store writes a new index version beside the active one and switches to it
+only when it is complete, so questions keep being answered from the old index while a
+rebuild runs. IndexRebuilder runs that build (and optionally precomputes the canned
+answers for the new index) on a worker thread and keeps its progress for the UI to poll.
+One rebuild runs at a time per process."""
+
+import threading
+import time
+from typing import Optional
+
+from questions import canned_questions
+from rag import build_vector_store, format_build_report, precompute_answers
+
+
+class IndexRebuilder:
+    """Runs rebuilds on a background thread. Safe to share between Streamlit sessions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._status = {"state": "idle", "stage": None, "done": 0, "total": 0, "message": None, "finished_at": None}
+
+    @property
+    def running(self) -> bool:
+        with self._lock:
+            return self._status["state"] == "running"
+
+    def status(self) -> dict:
+        """Snapshot: state (idle, running, done or failed), stage, done/total embeddings,
+        message (build report or error) and finished_at."""
+        with self._lock:
+            return dict(self._status)
+
+    def start(self, warm: bool = False) -> bool:
+        """Start a rebuild; returns False if one is already running."""
+        with self._lock:
+            if self._status["state"] == "running":
+                return False
+            self._status = {
+                "state": "running", "stage": "Scanning documents", "done": 0, "total": 0,
+                "message": None, "finished_at": None,
+            }
+            self._thread = threading.Thread(target=self._run, args=(warm,), name="index-rebuild", daemon=True)
+            self._thread.start()
+        return True
+
+    def join(self, timeout: Optional[float] = None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _update(self, **fields):
+        with self._lock:
+            self._status.update(fields)
+
+    def _progress(self, done: int, total: int):
+        self._update(stage="Embedding changed chunks", done=done, total=total)
+
+    def _run(self, warm: bool):
+        try:
+            report = build_vector_store(progress=self._progress)
+        except Exception as e:
+            print(f"Error rebuilding index: {e}")
+            self._update(state="failed", stage=None, message=str(e), finished_at=time.time())
+            return
+        message = format_build_report(report)
+        if warm:
+            # The new index is already live; a failed warm-up only means no precomputed answers
+            self._update(stage="Precomputing FAQ answers", done=0, total=0)
+            try:
+                warmed = precompute_answers(canned_questions())
+                message += f"; precomputed {warmed['answered']} answers"
+            except Exception as e:
+                print(f"Error precomputing answers: {e}")
+                message += f"; precompute failed: {e}"
+        self._update(state="done", stage=None, message=message, finished_at=time.time())
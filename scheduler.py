@@ -0,0 +1,289 @@
+"""Process-wide scheduler for OpenAI calls.
+
+Every chat completion and embedding request made by the engine (and by index builds) goes
+through one LLMScheduler, so all Streamlit sessions, the answer service and background
+jobs share one budget instead of each discovering the rate limit on its own:
+
+    - a token bucket per call kind (chat, embedding) for requests and for tokens per
+      minute, refilled continuously (HR_CHAT_RPM / HR_CHAT_TPM,
+      HR_EMBEDDING_RPM / HR_EMBEDDING_TPM; 0 disables a limit)
+    - at most HR_LLM_CONCURRENCY calls in flight (a streamed completion counts until its
+      stream ends)
+    - two priority classes: INTERACTIVE (someone is waiting for the answer) always goes
+      before BACKGROUND (index builds, answer precomputation); within a class, first come
+      first served
+    - rate-limit, connection and 5xx errors are retried up to HR_LLM_MAX_RETRIES times with
+      exponential backoff and jitter, honouring Retry-After
+
+Queue depth, calls in flight, queue wait, calls and retries are exported through
+telemetry.METRICS (and so the /metrics endpoint of server.py); the wait of each call is
+also added to the caller's trace as the llm_queue stage."""
+
+import asyncio
+import bisect
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from telemetry import METRICS, NULL_TRACE
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Requests and tokens per minute per call kind; defaults are OpenAI's tier-1 limits for
+# gpt-4o-mini and text-embedding-3-small
+RATE_LIMITS = {
+    "chat": (float(os.getenv("HR_CHAT_RPM", "500")), float(os.getenv("HR_CHAT_TPM", "200000"))),
+    "embedding": (float(os.getenv("HR_EMBEDDING_RPM", "3000")), float(os.getenv("HR_EMBEDDING_TPM", "1000000"))),
+}
+MAX_CONCURRENCY = int(os.getenv("HR_LLM_CONCURRENCY", "8"))
+MAX_RETRIES = int(os.getenv("HR_LLM_MAX_RETRIES", "4"))
+
+METRICS.describe("hr_llm_queue_depth", "gauge", "OpenAI calls waiting for the scheduler, by priority.")
+METRICS.describe("hr_llm_in_flight", "gauge", "OpenAI calls in flight.")
+METRICS.describe("hr_llm_queue_wait_seconds", "histogram", "Time OpenAI calls waited for the scheduler.")
+METRICS.describe("hr_llm_calls_total", "counter", "OpenAI calls started, by kind and priority.")
+METRICS.describe("hr_llm_retries_total", "counter", "OpenAI calls retried after a retryable error.")
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, connection problems, timeouts and server errors are worth retrying."""
+    import openai
+
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Honour Retry-After when the server sends one, else exponential backoff with jitter."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), 60.0)
+        except ValueError:
+            pass
+    return min(2 ** attempt, 30.0) * (0.5 + random.random() / 2)
+
+
+class TokenBucket:
+    """Holds up to per_minute units and refills at per_minute / 60 a second. Not
+    thread-safe; LLMScheduler guards it. per_minute <= 0 means unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (a request larger than the bucket waits for
+        a full bucket)."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        if self.capacity > 0:
+            self.level -= min(amount, self.capacity)
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "kind", "tokens", "granted")
+
+    def __init__(self, priority: int, seq: int, kind: str, tokens: int):
+        self.priority = priority
+        self.seq = seq
+        self.kind = kind
+        self.tokens = tokens
+        self.granted = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """Admits OpenAI calls in priority order within the rate limits and concurrency cap.
+    Safe to share between threads and event loops."""
+
+    def __init__(
+        self,
+        rate_limits: Optional[dict] = None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        max_retries: int = MAX_RETRIES,
+    ):
+        rate_limits = RATE_LIMITS if rate_limits is None else rate_limits
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._buckets = {
+            kind: (TokenBucket(requests), TokenBucket(tokens)) for kind, (requests, tokens) in rate_limits.items()
+        }
+        self._condition = threading.Condition()
+        self._waiting = []  # _Tickets in (priority, seq) order
+        self._seq = 0
+        self._in_flight = 0
+
+    def stats(self) -> dict:
+        """Current queue depth per priority class and calls in flight."""
+        with self._condition:
+            return self._stats()
+
+    def _stats(self) -> dict:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for ticket in self._waiting:
+            depth[PRIORITY_NAMES[ticket.priority]] += 1
+        return {"queued": depth, "in_flight": self._in_flight}
+
+    def _publish(self):
+        stats = self._stats()
+        for name, depth in stats["queued"].items():
+            METRICS.set("hr_llm_queue_depth", depth, priority=name)
+        METRICS.set("hr_llm_in_flight", stats["in_flight"])
+
+    def _dispatch(self) -> Optional[float]:
+        """Grant every waiting ticket that can start now, in priority order. A kind whose
+        bucket is empty blocks only later tickets of the same kind. Returns how long until
+        a bucket may have refilled enough for the next one, or None. Wakes the waiters
+        when it granted anything, since the tickets may belong to other threads."""
+        retry_in = None
+        blocked = set()
+        granted = False
+        for ticket in list(self._waiting):
+            if self._in_flight >= self.max_concurrency:
+                break
+            if ticket.kind in blocked:
+                continue
+            buckets = self._buckets.get(ticket.kind)
+            if buckets is not None:
+                wait = max(buckets[0].wait_time(1), buckets[1].wait_time(ticket.tokens))
+                if wait > 0:
+                    blocked.add(ticket.kind)
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                buckets[0].take(1)
+                buckets[1].take(ticket.tokens)
+            self._waiting.remove(ticket)
+            self._in_flight += 1
+            ticket.granted = True
+            granted = True
+        if granted:
+            self._condition.notify_all()
+        return retry_in
+
+    def acquire(self, tokens: int, priority: int = INTERACTIVE, kind: str = "chat") -> float:
+        """Block until the call may start; returns the seconds waited. Pair with release()."""
+        started = time.perf_counter()
+        with self._condition:
+            self._seq += 1
+            ticket = _Ticket(priority, self._seq, kind, tokens)
+            bisect.insort(self._waiting, ticket)
+            while True:
+                retry_in = self._dispatch()
+                if ticket.granted:
+                    break
+                self._publish()
+                self._condition.wait(timeout=retry_in)
+            self._publish()
+        waited = time.perf_counter() - started
+        METRICS.observe("hr_llm_queue_wait_seconds", waited, priority=PRIORITY_NAMES[priority])
+        METRICS.inc("hr_llm_calls_total", kind=kind, priority=PRIORITY_NAMES[priority])
+        return waited
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._publish()
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, tokens: int, priority: int = INTERACTIVE, kind: str = "chat", trace=NULL_TRACE):
+        """Hold one admitted call for the duration of the with block."""
+        trace.add_stage("llm_queue", self.acquire(tokens, priority, kind))
+        try:
+            yield
+        finally:
+            self.release()
+
+    def call(self, fn: Callable, tokens: int, priority: int = INTERACTIVE, kind: str = "chat", trace=NULL_TRACE):
+        """Run fn() once admitted, retrying retryable errors with backoff (each attempt is
+        admitted again). fn should not retry on its own. Use stream() for calls that return
+        a stream."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.slot(tokens, priority, kind, trace):
+                    return fn()
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                METRICS.inc("hr_llm_retries_total", kind=kind)
+                time.sleep(retry_delay(e, attempt))
+
+    def stream(self, fn: Callable, tokens: int, priority: int = INTERACTIVE, kind: str = "chat", trace=NULL_TRACE):
+        """call() for fn() returning a stream: yield its chunks, holding the slot until the
+        stream is used up or this generator is closed. Only opening the stream is retried."""
+        for attempt in range(self.max_retries + 1):
+            trace.add_stage("llm_queue", self.acquire(tokens, priority, kind))
+            try:
+                stream = fn()
+            except Exception as e:
+                self.release()
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                METRICS.inc("hr_llm_retries_total", kind=kind)
+                time.sleep(retry_delay(e, attempt))
+                continue
+            try:
+                yield from stream
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+                self.release()
+            return
+
+    async def acall(self, fn: Callable, tokens: int, priority: int = INTERACTIVE, kind: str = "chat", trace=NULL_TRACE):
+        """Async call(): fn() returns an awaitable. Waiting for admission happens on a worker
+        thread, so the event loop keeps running."""
+        for attempt in range(self.max_retries + 1):
+            admission = asyncio.ensure_future(asyncio.to_thread(self.acquire, tokens, priority, kind))
+            try:
+                trace.add_stage("llm_queue", await asyncio.shield(admission))
+            except asyncio.CancelledError:
+                # The worker thread still gets the slot; hand it back when it does
+                admission.add_done_callback(lambda f: f.cancelled() or f.exception() or self.release())
+                raise
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                METRICS.inc("hr_llm_retries_total", kind=kind)
+                delay = retry_delay(e, attempt)
+            finally:
+                self.release()
+            await asyncio.sleep(delay)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Return the process-wide scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
@@ -0,0 +1,190 @@
+"""Headless HTTP answer service for tools that cannot embed the Streamlit app.
+
+    python server.py --port 8000
+
+Endpoints:
+    POST /v1/answer   {"question": "...", "document_filter": "Vacation Policy.docx"}
+                      -> {"answer": "...", "coalesced": false}
+    GET  /healthz     process is up
+    GET  /readyz      200 once the chroma_db index is loaded, 503 before that
+    GET  /metrics     Prometheus metrics (answer and stage latencies need HR_TRACE=1)
+
+All requests share one HandbookRAG engine (and its pooled HTTP connections). Answers run
+on a bounded worker pool, and identical questions that arrive while one is already being
+answered wait for that result instead of running their own retrieval and completion."""
+
+import argparse
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from answer_cache import normalize_question
+from rag import HandbookRAG, index_version
+from telemetry import METRICS, render_prometheus
+
+MAX_BODY_BYTES = 16 * 1024
+MAX_QUESTION_CHARS = 2000
+ANSWER_TIMEOUT_SECONDS = 120
+
+METRICS.describe("hr_coalesced_requests_total", "counter", "Requests that waited on an identical in-flight question.")
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers with the same key share
+    the in-flight future."""
+
+    def __init__(self, executor: ThreadPoolExecutor):
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def submit(self, key, fn, *args):
+        """Return (future, coalesced) where coalesced is True if the call was already running."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, True
+            future = self._executor.submit(fn, *args)
+            self._inflight[key] = future
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future, False
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+
+class AnswerHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # socketserver's default backlog of 5 resets connections during a burst of questions
+    request_queue_size = 128
+
+
+class AnswerService:
+    def __init__(self, workers: int = 8):
+        self.engine = HandbookRAG()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="answer")
+        self.flights = SingleFlight(self.executor)
+
+    def warm_up(self):
+        """Open the index in the background so /readyz flips as soon as it is loaded."""
+        def _load():
+            try:
+                self.engine.collection()
+            except Exception as e:
+                print(f"Error loading index: {e}")
+
+        threading.Thread(target=_load, name="warm-up", daemon=True).start()
+
+    def is_ready(self) -> bool:
+        return self.engine.is_loaded and index_version() is not None
+
+    def answer(self, question: str, document_filter):
+        key = (normalize_question(question), document_filter or "")
+        future, coalesced = self.flights.submit(key, self.engine.answer, question, document_filter)
+        if coalesced:
+            METRICS.inc("hr_coalesced_requests_total")
+        return future.result(timeout=ANSWER_TIMEOUT_SECONDS), coalesced
+
+
+def make_handler(service: AnswerService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload: dict):
+            self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+        def _send(self, status: int, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/healthz":
+                self._send_json(200, {"status": "ok"})
+            elif self.path == "/metrics":
+                self._send(200, render_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+            elif self.path == "/readyz":
+                ready = service.is_ready()
+                self._send_json(200 if ready else 503, {"ready": ready, "index_version": index_version()})
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if self.path != "/v1/answer":
+                self._send_json(404, {"error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0 or length > MAX_BODY_BYTES:
+                # The body is left unread, so the connection cannot be reused
+                self.close_connection = True
+                if length < 0:
+                    self._send_json(400, {"error": "Invalid Content-Length"})
+                else:
+                    self._send_json(413, {"error": "Request body too large"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": "Body must be JSON"})
+                return
+            question = payload.get("question") if isinstance(payload, dict) else None
+            document_filter = payload.get("document_filter") if isinstance(payload, dict) else None
+            if not isinstance(question, str) or not question.strip():
+                self._send_json(400, {"error": "'question' is required"})
+                return
+            if len(question) > MAX_QUESTION_CHARS:
+                self._send_json(400, {"error": f"'question' is longer than {MAX_QUESTION_CHARS} characters"})
+                return
+            if document_filter is not None and not isinstance(document_filter, str):
+                self._send_json(400, {"error": "'document_filter' must be a string"})
+                return
+            try:
+                answer, coalesced = service.answer(question.strip(), document_filter or None)
+            except TimeoutError:
+                self._send_json(504, {"error": f"No answer within {ANSWER_TIMEOUT_SECONDS} seconds"})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, {"answer": answer, "coalesced": coalesced})
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HR Assistant answer service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=8, help="concurrent answers (default 8)")
+    args = parser.parse_args()
+
+    service = AnswerService(workers=args.workers)
+    service.warm_up()
+    server = AnswerHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving answers on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
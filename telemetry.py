@@ -0,0 +1,215 @@
+"""Per-answer tracing and Prometheus-style metrics.
+
+Set HR_TRACE=1 to trace every answer: stage durations, chunk counts, token usage, cache
+hit/miss and index version are appended as one JSON line per answer to HR_TRACE_LOG
+(default logs/traces.jsonl) and aggregated into the metrics returned by render_prometheus().
+
+With tracing off, start_trace returns NULL_TRACE, whose methods do nothing, so the cost
+per answer is a couple of no-op calls."""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+TRACE_ENABLED = os.getenv("HR_TRACE", "0").lower() in ("1", "true", "yes")
+TRACE_LOG = Path(os.getenv("HR_TRACE_LOG") or Path(__file__).parent / "logs" / "traces.jsonl")
+
+# Histogram buckets in seconds, from a cache hit up to a slow completion
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics:
+    """Thread-safe counters and histograms rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._help = {}
+
+    def describe(self, name: str, kind: str, text: str):
+        self._help[name] = (kind, text)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self) -> str:
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            series = {}
+            for (name, labels), value in self._counters.items():
+                series.setdefault(name, []).append(f"{name}{fmt(labels)} {value:g}")
+            for (name, labels), value in self._gauges.items():
+                series.setdefault(name, []).append(f"{name}{fmt(labels)} {value:g}")
+            for (name, labels), histogram in self._histograms.items():
+                out = series.setdefault(name, [])
+                for bound, count in zip(BUCKETS, histogram):
+                    out.append(f"{name}_bucket{fmt(labels, [('le', f'{bound:g}')])} {count}")
+                out.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {histogram[-1]}")
+                out.append(f"{name}_sum{fmt(labels)} {histogram[-2]:g}")
+                out.append(f"{name}_count{fmt(labels)} {histogram[-1]}")
+        for name in sorted(series):
+            if name in self._help:
+                kind, text = self._help[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+            lines.extend(series[name])
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+METRICS.describe("hr_answers_total", "counter", "Answers served, by cache outcome.")
+METRICS.describe("hr_answer_seconds", "histogram", "End-to-end answer latency.")
+METRICS.describe("hr_stage_seconds", "histogram", "Time spent in each answer stage.")
+METRICS.describe("hr_prompt_tokens_total", "counter", "Prompt tokens sent to the chat model.")
+METRICS.describe("hr_completion_tokens_total", "counter", "Completion tokens received from the chat model.")
+METRICS.describe("hr_context_tokens_saved_total", "counter", "Prompt tokens saved by context assembly.")
+METRICS.describe("hr_answer_errors_total", "counter", "Answers that raised an error.")
+
+
+def render_prometheus() -> str:
+    return METRICS.render()
+
+
+class Trace:
+    """Timing and attributes for one answer."""
+
+    enabled = True
+
+    def __init__(self, question: str, document_filter: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.question = question
+        self.document_filter = document_filter
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.stages = {}
+        self.attrs = {}
+        self.total_ms = None
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started)
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "ts": self.started_at,
+            "question": self.question,
+            "document_filter": self.document_filter,
+            "total_ms": self.total_ms,
+            "stages_ms": {name: round(ms, 3) for name, ms in self.stages.items()},
+            **self.attrs,
+        }
+
+    def finish(self):
+        """Record the trace in the metrics and the JSON-lines log. Safe to call twice."""
+        if self.total_ms is not None:
+            return
+        seconds = time.perf_counter() - self._started
+        self.total_ms = round(seconds * 1000, 3)
+        METRICS.inc("hr_answers_total", cache=self.attrs.get("cache", "off"))
+        METRICS.observe("hr_answer_seconds", seconds)
+        for name, ms in self.stages.items():
+            METRICS.observe("hr_stage_seconds", ms / 1000, stage=name)
+        if self.attrs.get("prompt_tokens"):
+            METRICS.inc("hr_prompt_tokens_total", self.attrs["prompt_tokens"])
+        if self.attrs.get("completion_tokens"):
+            METRICS.inc("hr_completion_tokens_total", self.attrs["completion_tokens"])
+        if self.attrs.get("tokens_saved"):
+            METRICS.inc("hr_context_tokens_saved_total", self.attrs["tokens_saved"])
+        if self.attrs.get("error"):
+            METRICS.inc("hr_answer_errors_total")
+        _write_trace(self.to_dict())
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTrace:
+    """Stand-in used when tracing is off; every method is a no-op."""
+
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name: str):
+        return self._stage
+
+    def add_stage(self, name: str, seconds: float):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+    def finish(self):
+        pass
+
+    def to_dict(self) -> dict:
+        return {}
+
+
+NULL_TRACE = NullTrace()
+
+_log_lock = threading.Lock()
+
+
+def _write_trace(record: dict):
+    try:
+        with _log_lock:
+            TRACE_LOG.parent.mkdir(parents=True, exist_ok=True)
+            with open(TRACE_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Error writing trace: {e}")
+
+
+def start_trace(question: str, document_filter: Optional[str] = None, force: bool = False):
+    """Return a Trace when tracing is enabled (or force is set), else NULL_TRACE."""
+    if TRACE_ENABLED or force:
+        return Trace(question, document_filter)
+    return NULL_TRACE
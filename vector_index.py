@@ -0,0 +1,101 @@
+"""In-process exact vector search over a memory-mapped embedding matrix.
+
+Every build exports the chunk vectors of its index version next to the manifest:
+
+    vectors.f32    float32 matrix, one unit-length row per chunk (row-major, no header)
+    vectors.json   dimensions, and the chunk id and source document of every row
+
+VectorIndex maps the matrix read-only, so worker processes serving the same version share
+one copy through the page cache, and scores a batch of queries with a single matrix
+product: cosine top-k is an argpartition over rows. A document_filter restricts scoring
+to that document's rows, whose positions are computed once at load.
+
+For a corpus of a few hundred to a few thousand chunks this is exact and faster than a
+Chroma query, which goes through SQLite and the HNSW index. HR_VECTOR_BACKEND selects
+which one the engine uses (chroma by default; numpy for this index)."""
+
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+VECTOR_BACKEND = os.getenv("HR_VECTOR_BACKEND", "chroma").lower()
+MATRIX_NAME = "vectors.f32"
+META_NAME = "vectors.json"
+
+
+def export_vectors(directory: Path, ids, sources, embeddings):
+    """Write the unit-normalised embeddings with their chunk ids and sources to directory."""
+    import numpy as np
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    matrix.tofile(directory / MATRIX_NAME)
+    (directory / META_NAME).write_text(json.dumps({
+        "dimensions": int(matrix.shape[1]),
+        "ids": list(ids),
+        "sources": list(sources),
+    }))
+
+
+class VectorIndex:
+    """Read-only cosine search over an exported matrix. Safe to share between threads."""
+
+    def __init__(self, matrix, ids, sources):
+        import numpy as np
+
+        self.matrix = matrix
+        self.ids = ids
+        self._source_rows = {}
+        for row, source in enumerate(sources):
+            self._source_rows.setdefault(source, []).append(row)
+        self._source_rows = {source: np.asarray(rows, dtype=np.int64) for source, rows in self._source_rows.items()}
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["VectorIndex"]:
+        """Map the matrix in directory, or return None if it was never exported."""
+        import numpy as np
+
+        try:
+            meta = json.loads((directory / META_NAME).read_text())
+        except (OSError, ValueError):
+            return None
+        shape = (len(meta["ids"]), meta["dimensions"])
+        matrix = np.memmap(directory / MATRIX_NAME, dtype=np.float32, mode="r", shape=shape)
+        return cls(matrix, meta["ids"], meta["sources"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query_vectors, k: int, source: Optional[str] = None):
+        """Top k rows by cosine similarity for each query vector, restricted to source when
+        given. Returns one [(chunk id, cosine distance)] list per query, closest first."""
+        import numpy as np
+
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        if queries.shape[1] != self.matrix.shape[1]:
+            raise ValueError(f"Query vectors have {queries.shape[1]} dimensions, the index has {self.matrix.shape[1]}")
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        rows = None
+        matrix = self.matrix
+        if source:
+            rows = self._source_rows.get(source)
+            if rows is None:
+                return [[] for _ in queries]
+            matrix = matrix[rows]
+        k = min(k, matrix.shape[0])
+        if k == 0:
+            return [[] for _ in queries]
+
+        scores = queries @ matrix.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        if rows is not None:
+            top = rows[top]
+        return [
+            [(self.ids[j], float(1.0 - score)) for j, score in zip(row_ids, row_scores)]
+            for row_ids, row_scores in zip(top.tolist(), top_scores.tolist())
+        ]